@@ -47,6 +47,8 @@ class NetworkClient {
         unsigned long lastPollTime = 0;
         unsigned long lastTelemetryTime = 0;
         unsigned long lastDemoPollTime = 0;
+        String configEtag; // Last ETag per endpoint, sent back as If-None-Match
+        String demoEtag;
         Preferences preferences; // For non-volatile storage
     };
     
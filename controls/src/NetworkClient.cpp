@@ -7,6 +7,9 @@ String API_CONFIG;
 String API_TELEMETRY;
 String API_DEMO_CONTROL;
 
+// Response headers kept by HTTPClient (it discards the rest)
+static const char *ETAG_HEADERS[] = {"ETag"};
+
 void NetworkClient::updateEndpoints() {
     API_CONFIG = BASE_URL + "/devices/" + DEVICE_ID + "/fetchRefVals";
     API_TELEMETRY = BASE_URL + "/sendTelemetry";
@@ -62,9 +65,15 @@ void NetworkClient::fetchReferenceValues(SystemTargets &targets) {
         // Use the Config endpoint: GET /devices/{id}/config
         if (http.begin(client, API_CONFIG)) { 
             Serial.println("NET: Fetching Reference Values...");
+            // Server answers 304 with no body while the config is unchanged
+            http.collectHeaders(ETAG_HEADERS, 1);
+            if (configEtag.length() > 0) http.addHeader("If-None-Match", configEtag);
             int httpCode = http.GET();
 
-            if (httpCode > 0) {
+            if (httpCode == HTTP_CODE_NOT_MODIFIED) {
+                Serial.println("NET: Config unchanged");
+            } else if (httpCode > 0) {
+                if (httpCode == HTTP_CODE_OK) configEtag = http.header("ETag");
                 String payload = http.getString();
                 Serial.println("NET: Config Received: " + payload);
                 
@@ -84,6 +93,25 @@ void NetworkClient::fetchReferenceValues(SystemTargets &targets) {
     }
 }
 
+// MessagePack encoders for the compact telemetry array (big-endian per spec)
+static void packFloat(uint8_t *buf, size_t &len, float value) {
+    uint32_t bits;
+    memcpy(&bits, &value, sizeof(bits));
+    buf[len++] = 0xca; // float 32
+    buf[len++] = bits >> 24;
+    buf[len++] = bits >> 16;
+    buf[len++] = bits >> 8;
+    buf[len++] = bits;
+}
+
+static void packString(uint8_t *buf, size_t &len, const String &value) {
+    size_t n = value.length() > 64 ? 64 : value.length(); // device ids are short
+    buf[len++] = 0xd9; // str 8
+    buf[len++] = n;
+    memcpy(buf + len, value.c_str(), n);
+    len += n;
+}
+
 void NetworkClient::sendTelemetryData(SensorData data) {
     if (millis() - lastTelemetryTime < TELEMETRY_INTERVAL_MS) return;
     lastTelemetryTime = millis();
@@ -94,35 +122,27 @@ void NetworkClient::sendTelemetryData(SensorData data) {
         
         if (http.begin(client, API_TELEMETRY)) {
             
-            // Construct Nested JSON matching 'TelemetryIn' & 'SensorReadings'
-            // {
-            //   "device_id": "PlantBox-492",
-            //   "sensors": {
-            //      "air_temp_c": 24.5,
-            //      ...
-            //   }
-            // }
-            
-            String jsonPayload = "{";
-            jsonPayload += "\"device_id\": \"" + String(DEVICE_ID) + "\",";
-            
-            jsonPayload += "\"sensors\": {";
-            jsonPayload += "\"air_temp_c\": " + String(data.air_temp_c) + ",";
-            jsonPayload += "\"humidity_pct\": " + String(data.humidity_pct) + ",";
-            jsonPayload += "\"light_intensity_pct\": " + String(data.light_intensity_pct) + ",";
-            jsonPayload += "\"water_level_pct\": " + String(data.water_level_pct) + ",";
-            jsonPayload += "\"nutrient_a_pct\": " + String(data.nutrient_a_pct) + ",";
-            jsonPayload += "\"moisture_pct\": " + String(data.moisture_pct) + ",";
-            jsonPayload += "\"power_mw\": " + String(data.power_mw);
-            jsonPayload += "}"; 
-            
-            // Note: 'captured_at' is optional (has default in Python), so we omit it here.
-            jsonPayload += "}";
-
-            http.addHeader("Content-Type", "application/json");
-
-            Serial.println("NET: Sending Telemetry -> " + jsonPayload);
-            int httpResponseCode = http.POST(jsonPayload);
+            // Compact MessagePack array, decoded by the server in this order:
+            // [device_id, air_temp_c, humidity_pct, light_intensity_pct,
+            //  water_level_pct, nutrient_a_pct, moisture_pct, power_mw]
+            // 'captured_at' is optional (server receive time is used), so we omit it here.
+            uint8_t payload[128];
+            size_t len = 0;
+            payload[len++] = 0x98; // fixarray, 8 items
+            packString(payload, len, DEVICE_ID);
+            packFloat(payload, len, data.air_temp_c);
+            packFloat(payload, len, data.humidity_pct);
+            packFloat(payload, len, data.light_intensity_pct);
+            packFloat(payload, len, data.water_level_pct);
+            packFloat(payload, len, data.nutrient_a_pct);
+            packFloat(payload, len, data.moisture_pct);
+            packFloat(payload, len, data.power_mw);
+
+            http.addHeader("Content-Type", "application/msgpack");
+
+            Serial.printf("NET: Sending Telemetry (%u bytes) -> T=%.1f H=%.1f W=%.1f P=%.1fmW\n",
+                          (unsigned)len, data.air_temp_c, data.humidity_pct, data.water_level_pct, data.power_mw);
+            int httpResponseCode = http.POST(payload, len);
 
             if (httpResponseCode > 0) {
                 // Serial.print("NET: Telemetry Sent. Code: ");
@@ -148,9 +168,14 @@ void NetworkClient::fetchDemoControl(DemoState &state) {
         HTTPClient http;
 
         if (http.begin(client, API_DEMO_CONTROL)) {
+            http.collectHeaders(ETAG_HEADERS, 1);
+            if (demoEtag.length() > 0) http.addHeader("If-None-Match", demoEtag);
             int httpCode = http.GET();
 
-            if (httpCode > 0) {
+            if (httpCode == HTTP_CODE_NOT_MODIFIED) {
+                // Unchanged since the last poll; keep the current state
+            } else if (httpCode > 0) {
+                if (httpCode == HTTP_CODE_OK) demoEtag = http.header("ETag");
                 String payload = http.getString();
                 Serial.println("NET: Demo Control Received: " + payload);
 
@@ -1,24 +1,41 @@
 """Simple SMTP email client."""
 
+from contextlib import contextmanager
 from dataclasses import dataclass
 from email.message import EmailMessage
 import smtplib
-from typing import Iterable
+import threading
+import time
+from typing import Iterable, Iterator, List, Tuple
 
 
 @dataclass
 class EmailConfig:
-    """Configuration for connecting to an SMTP server."""
+    """Configuration for connecting to an SMTP server.
+
+    Attributes:
+        pool_size: Maximum number of concurrently open SMTP sessions.
+        idle_timeout: Seconds an idle session is kept before it is closed.
+        timeout: Socket timeout for SMTP operations, in seconds.
+    """
 
     smtp_server: str
     smtp_port: int
     username: str
     password: str
     use_tls: bool = True
+    pool_size: int = 2
+    idle_timeout: float = 60.0
+    timeout: float = 30.0
 
 
 class EmailClient:
-    """Client for sending plain text emails via SMTP."""
+    """Client for sending plain text emails via SMTP.
+
+    Authenticated sessions are pooled and reused between sends, so the
+    connect, STARTTLS and login cost is paid once per session rather than
+    once per message. The client is safe to share between threads.
+    """
 
     def __init__(self, config: EmailConfig) -> None:
         """Initialize the client.
@@ -27,26 +44,137 @@ class EmailClient:
             config: SMTP connection settings.
         """
         self.config = config
+        self._idle: List[Tuple[smtplib.SMTP, float]] = []
+        self._lock = threading.Lock()
+        self._slots = threading.BoundedSemaphore(max(1, config.pool_size))
 
-    def send_email(
-        self, subject: str, body: str, from_email: str, to_emails: Iterable[str]
-    ) -> None:
-        """Send an email message.
+    def __enter__(self) -> "EmailClient":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+    @staticmethod
+    def build_message(
+        subject: str, body: str, from_email: str, to_emails: Iterable[str]
+    ) -> EmailMessage:
+        """Build a plain text message.
 
         Args:
             subject: Email subject line.
             body: Plain text email body.
             from_email: Sender email address.
             to_emails: Recipient email addresses.
+
+        Returns:
+            The assembled message.
         """
         message = EmailMessage()
         message["Subject"] = subject
         message["From"] = from_email
         message["To"] = ", ".join(to_emails)
         message.set_content(body, charset="utf-8")
+        return message
 
-        with smtplib.SMTP(self.config.smtp_server, self.config.smtp_port) as smtp:
+    def send_email(
+        self, subject: str, body: str, from_email: str, to_emails: Iterable[str]
+    ) -> None:
+        """Send an email message.
+
+        Args:
+            subject: Email subject line.
+            body: Plain text email body.
+            from_email: Sender email address.
+            to_emails: Recipient email addresses.
+        """
+        self.send_many([self.build_message(subject, body, from_email, to_emails)])
+
+    def send_many(self, messages: Iterable[EmailMessage]) -> int:
+        """Send several messages over a single SMTP session.
+
+        If the server drops the session part-way through, the client
+        reconnects once and resumes with the message that failed.
+
+        Args:
+            messages: Messages to send, in order.
+
+        Returns:
+            Number of messages sent.
+        """
+        sent = 0
+        with self._session() as holder:
+            for message in messages:
+                try:
+                    holder[0].send_message(message)
+                except smtplib.SMTPServerDisconnected:
+                    self._discard(holder[0])
+                    holder[0] = self._connect()
+                    holder[0].send_message(message)
+                sent += 1
+        return sent
+
+    def close(self) -> None:
+        """Close all idle pooled sessions."""
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for smtp, _ in idle:
+            self._discard(smtp)
+
+    def _connect(self) -> smtplib.SMTP:
+        smtp = smtplib.SMTP(
+            self.config.smtp_server, self.config.smtp_port, timeout=self.config.timeout
+        )
+        try:
             if self.config.use_tls:
                 smtp.starttls()
             smtp.login(self.config.username, self.config.password)
-            smtp.send_message(message)
+        except Exception:
+            self._discard(smtp)
+            raise
+        return smtp
+
+    @staticmethod
+    def _discard(smtp: smtplib.SMTP) -> None:
+        try:
+            smtp.quit()
+        except Exception:
+            smtp.close()
+
+    def _acquire(self) -> smtplib.SMTP:
+        """Return a pooled session, opening a new one if none is usable."""
+        now = time.monotonic()
+        stale = []
+        smtp = None
+        with self._lock:
+            while self._idle:
+                candidate, last_used = self._idle.pop()
+                if now - last_used > self.config.idle_timeout:
+                    stale.append(candidate)
+                    continue
+                smtp = candidate
+                break
+        for candidate in stale:
+            self._discard(candidate)
+        return smtp or self._connect()
+
+    @contextmanager
+    def _session(self) -> Iterator[List[smtplib.SMTP]]:
+        """Check out a session for the duration of the block.
+
+        Yields a one-item list so the caller can swap in a reconnected
+        session. Sessions that raise are closed instead of returned.
+        """
+        self._slots.acquire()
+        holder: List[smtplib.SMTP] = []
+        try:
+            holder.append(self._acquire())
+            yield holder
+        except Exception:
+            if holder:
+                self._discard(holder[0])
+            raise
+        else:
+            with self._lock:
+                self._idle.append((holder[0], time.monotonic()))
+        finally:
+            self._slots.release()
@@ -1,5 +1,6 @@
 """MongoDB library public API."""
 
+from .async_storage import AsyncMongoStorage
 from .storage import MongoConfig, MongoStorage
 
-__all__ = ["MongoConfig", "MongoStorage"]
+__all__ = ["AsyncMongoStorage", "MongoConfig", "MongoStorage"]
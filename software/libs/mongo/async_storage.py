@@ -0,0 +1,450 @@
+"""Asynchronous MongoDB storage helpers."""
+
+from __future__ import annotations
+
+from datetime import datetime
+from typing import Any, Dict, Iterable, List, Optional, Sequence
+
+from pymongo import AsyncMongoClient, UpdateOne
+from pymongo.asynchronous.collection import AsyncCollection
+from pymongo.asynchronous.command_cursor import AsyncCommandCursor
+from pymongo.asynchronous.cursor import AsyncCursor
+from pymongo.errors import OperationFailure
+from pymongo.results import BulkWriteResult
+
+from .storage import MongoConfig, SortSpec, _sort_spec
+
+
+class AsyncMongoStorage:
+    """MongoDB storage wrapper for asyncio code.
+
+    Mirrors ``MongoStorage`` method for method on top of pymongo's native
+    ``AsyncMongoClient``; every method that talks to the server is a
+    coroutine.
+    """
+
+    def __init__(
+        self, config: MongoConfig, client: Optional[AsyncMongoClient] = None
+    ) -> None:
+        """Initialize the storage with configuration.
+
+        Args:
+            config: Connection information.
+            client: Optional pre-initialized ``AsyncMongoClient`` for testing.
+        """
+
+        self._client = client or AsyncMongoClient(config.uri, **config.client_options())
+        self._db = self._client[config.db_name]
+
+    def get_collection(self, name: str) -> AsyncCollection:
+        """Return a collection handle by name.
+
+        Args:
+            name: Target collection.
+
+        Returns:
+            Collection instance.
+        """
+
+        return self._db[name]
+
+    async def list_collections(self) -> list[str]:
+        """Return all collection names in the database."""
+
+        return list(await self._db.list_collection_names())
+
+    async def create_collection(self, name: str) -> None:
+        """Create a new collection."""
+
+        await self._db.create_collection(name)
+
+    async def drop_collection(self, name: str) -> None:
+        """Drop a collection by name."""
+
+        await self.get_collection(name).drop()
+
+    async def collection_type(self, name: str) -> Optional[str]:
+        """Return ``"collection"``, ``"timeseries"``, ``"view"`` or ``None`` if missing."""
+
+        cursor = await self._db.list_collections(filter={"name": name})
+        async for info in cursor:
+            return info.get("type", "collection")
+        return None
+
+    async def create_timeseries_collection(
+        self,
+        name: str,
+        time_field: str,
+        meta_field: Optional[str] = None,
+        granularity: str = "seconds",
+        expire_after_seconds: Optional[int] = None,
+    ) -> None:
+        """Create a time-series collection (MongoDB 5.0+).
+
+        Args:
+            name: Collection to create.
+            time_field: Field holding each measurement's timestamp.
+            meta_field: Field identifying the series, e.g. a device id.
+            granularity: ``"seconds"``, ``"minutes"`` or ``"hours"``.
+            expire_after_seconds: Optional retention; older buckets are deleted.
+        """
+
+        timeseries: Dict[str, Any] = {"timeField": time_field, "granularity": granularity}
+        if meta_field:
+            timeseries["metaField"] = meta_field
+        options: Dict[str, Any] = {"timeseries": timeseries}
+        if expire_after_seconds:
+            options["expireAfterSeconds"] = expire_after_seconds
+        await self._db.create_collection(name, **options)
+
+    async def set_retention(
+        self, name: str, time_field: str, expire_after_seconds: Optional[int]
+    ) -> None:
+        """Apply a retention period to a collection.
+
+        Time-series collections use their native ``expireAfterSeconds``;
+        regular collections get a TTL index on ``time_field``. ``None`` or
+        ``0`` turns expiry off for time-series collections and leaves
+        regular collections untouched.
+
+        Args:
+            name: Target collection.
+            time_field: Timestamp field used for expiry.
+            expire_after_seconds: Retention in seconds.
+        """
+
+        if await self.collection_type(name) == "timeseries":
+            await self._db.command(
+                "collMod", name, expireAfterSeconds=expire_after_seconds or "off"
+            )
+            return
+        if not expire_after_seconds:
+            return
+        index_name = f"{time_field}_ttl"
+        try:
+            await self.get_collection(name).create_index(
+                [(time_field, 1)], name=index_name, expireAfterSeconds=expire_after_seconds
+            )
+        except OperationFailure:
+            # The TTL index exists with another period; change it in place
+            await self._db.command(
+                "collMod",
+                name,
+                index={"name": index_name, "expireAfterSeconds": expire_after_seconds},
+            )
+
+    async def migrate_to_timeseries(
+        self,
+        name: str,
+        time_field: str,
+        meta_field: Optional[str] = None,
+        granularity: str = "seconds",
+        expire_after_seconds: Optional[int] = None,
+        chunk_size: int = 5000,
+        source: Optional[str] = None,
+    ) -> int:
+        """Convert a regular collection into a time-series collection.
+
+        The existing collection is renamed to ``<name>_legacy_<timestamp>``,
+        a time-series collection is created under the original name, and
+        documents are copied across in ``_id`` order, ``chunk_size`` at a
+        time. Writers may keep inserting into ``name`` while the copy runs.
+        The legacy collection is kept for the caller to verify and drop.
+
+        A copy that stopped part-way is resumed by passing the legacy
+        collection as ``source``: copying restarts after the newest ``_id``
+        from ``source`` already present in ``name``. Chunks are inserted in
+        order, so everything before that ``_id`` has been copied.
+
+        Args:
+            name: Collection to convert.
+            time_field: Field holding each measurement's timestamp.
+            meta_field: Field identifying the series.
+            granularity: Time-series bucket granularity.
+            expire_after_seconds: Optional retention for the new collection.
+            chunk_size: Documents copied per ``insert_many``.
+            source: Legacy collection of an interrupted migration to resume.
+
+        Returns:
+            Number of documents copied.
+
+        Raises:
+            ValueError: If ``source`` is given but ``name`` is a regular
+                collection.
+        """
+
+        kind = await self.collection_type(name)
+        if source is None:
+            if kind == "timeseries":
+                return 0
+            if kind is None:
+                await self.create_timeseries_collection(
+                    name, time_field, meta_field, granularity, expire_after_seconds
+                )
+                return 0
+            source = f"{name}_legacy_{datetime.utcnow():%Y%m%d%H%M%S}"
+            await self.get_collection(name).rename(source)
+            kind = None
+        if kind is None:
+            await self.create_timeseries_collection(
+                name, time_field, meta_field, granularity, expire_after_seconds
+            )
+        elif kind != "timeseries":
+            raise ValueError(f"'{name}' is not a time-series collection; nothing to resume")
+
+        query: Dict[str, Any] = {time_field: {"$type": "date"}}
+        last_id = await self._last_copied_id(source, name)
+        if last_id is not None:
+            query["_id"] = {"$gt": last_id}
+
+        target = self.get_collection(name)
+        copied = 0
+        chunk = []
+        cursor = (
+            self.get_collection(source)
+            .find(query)
+            .sort("_id", 1)
+            .batch_size(chunk_size)
+        )
+        async for document in cursor:
+            chunk.append(document)
+            if len(chunk) >= chunk_size:
+                await target.insert_many(chunk, ordered=True)
+                copied += len(chunk)
+                chunk = []
+        if chunk:
+            await target.insert_many(chunk, ordered=True)
+            copied += len(chunk)
+        return copied
+
+    async def _last_copied_id(self, source: str, target: str) -> Any:
+        """Newest ``_id`` of ``source`` already in ``target``, or ``None``.
+
+        Documents written to ``target`` after the rename have newer
+        ObjectIds than anything in ``source``, so only ids up to the
+        newest one in ``source`` are considered.
+        """
+
+        newest = await self.get_collection(source).find_one({}, {"_id": 1}, sort=[("_id", -1)])
+        if newest is None:
+            return None
+        copied = await self.get_collection(target).find_one(
+            {"_id": {"$lte": newest["_id"]}}, {"_id": 1}, sort=[("_id", -1)]
+        )
+        return copied["_id"] if copied else None
+
+    async def insert_one(self, collection: str, document: Dict[str, Any]) -> str:
+        """Insert a single document.
+
+        Args:
+            collection: Target collection.
+            document: Document to insert.
+
+        Returns:
+            Stringified inserted document ID.
+        """
+
+        result = await self.get_collection(collection).insert_one(document)
+        return str(result.inserted_id)
+
+    async def insert_many(
+        self, collection: str, documents: List[Dict[str, Any]], ordered: bool = False
+    ) -> int:
+        """Insert many documents in as few round trips as the driver allows.
+
+        Args:
+            collection: Target collection.
+            documents: Documents to insert; an empty list is a no-op.
+            ordered: Stop at the first failed document instead of
+                attempting the rest.
+
+        Returns:
+            Number of inserted documents.
+        """
+
+        if not documents:
+            return 0
+        result = await self.get_collection(collection).insert_many(documents, ordered=ordered)
+        return len(result.inserted_ids)
+
+    async def bulk_write(
+        self, collection: str, operations: List[Any], ordered: bool = False
+    ) -> Optional[BulkWriteResult]:
+        """Run mixed write operations (``UpdateOne``, ``InsertOne``...) in one batch.
+
+        Args:
+            collection: Target collection.
+            operations: pymongo write operations; an empty list is a no-op.
+            ordered: Stop at the first failed operation.
+
+        Returns:
+            The driver's result, or ``None`` when there was nothing to write.
+        """
+
+        if not operations:
+            return None
+        return await self.get_collection(collection).bulk_write(operations, ordered=ordered)
+
+    async def upsert_many(
+        self,
+        collection: str,
+        documents: Iterable[Dict[str, Any]],
+        key: Sequence[str],
+        ordered: bool = False,
+    ) -> int:
+        """Insert or update documents matched on their ``key`` fields.
+
+        Each document is ``$set`` onto the stored one, so fields it does not
+        carry are left unchanged.
+
+        Args:
+            collection: Target collection.
+            documents: Documents to write.
+            key: Fields identifying a document, e.g. ``["hardware_id"]``.
+            ordered: Stop at the first failed write.
+
+        Returns:
+            Number of inserted plus modified documents.
+        """
+
+        operations = [
+            UpdateOne({field: document[field] for field in key}, {"$set": document}, upsert=True)
+            for document in documents
+        ]
+        result = await self.bulk_write(collection, operations, ordered=ordered)
+        if result is None:
+            return 0
+        return result.upserted_count + result.modified_count
+
+    async def find_one(
+        self,
+        collection: str,
+        query: Dict[str, Any],
+        projection: Optional[Dict[str, Any]] = None,
+        sort: Optional[SortSpec] = None,
+    ) -> Optional[Dict[str, Any]]:
+        """Find a single document matching the query.
+
+        Args:
+            collection: Target collection.
+            query: MongoDB filter query.
+            projection: Fields to include or exclude.
+            sort: Sort key or list of ``(field, direction)`` pairs deciding
+                which match is returned.
+
+        Returns:
+            The first matching document or ``None``.
+        """
+
+        return await self.get_collection(collection).find_one(
+            query, projection, sort=_sort_spec(sort)
+        )
+
+    def find(
+        self,
+        collection: str,
+        query: Dict[str, Any],
+        projection: Optional[Dict[str, Any]] = None,
+        sort: Optional[SortSpec] = None,
+        limit: int = 0,
+        hint: Optional[Any] = None,
+        batch_size: int = 0,
+    ) -> AsyncCursor:
+        """Return a cursor over documents matching the query (use ``async for``).
+
+        Arguments match ``MongoStorage.find``.
+        """
+
+        return self.get_collection(collection).find(
+            query, projection, sort=_sort_spec(sort), limit=limit, hint=hint, batch_size=batch_size
+        )
+
+    async def aggregate(
+        self, collection: str, pipeline: List[Dict[str, Any]], batch_size: Optional[int] = None
+    ) -> AsyncCommandCursor:
+        """Run an aggregation pipeline.
+
+        Args:
+            collection: Collection the pipeline starts from.
+            pipeline: Aggregation stages.
+            batch_size: Documents per network round trip; ``None`` keeps the
+                server default.
+
+        Returns:
+            Cursor over the pipeline output.
+        """
+
+        options = {"batchSize": batch_size} if batch_size else {}
+        return await self.get_collection(collection).aggregate(pipeline, **options)
+
+    async def update_one(
+        self,
+        collection: str,
+        query: Dict[str, Any],
+        update: Dict[str, Any],
+        upsert: bool = False,
+    ) -> int:
+        """Update a single document.
+
+        Args:
+            collection: Target collection.
+            query: Filter selecting the document to update.
+            update: Update operations.
+            upsert: Insert a new document when none matches.
+
+        Returns:
+            Number of modified documents.
+        """
+
+        result = await self.get_collection(collection).update_one(query, update, upsert=upsert)
+        return result.modified_count
+
+    async def update_many(
+        self,
+        collection: str,
+        query: Dict[str, Any],
+        update: Dict[str, Any],
+    ) -> int:
+        """Update every document matching the query.
+
+        Args:
+            collection: Target collection.
+            query: Filter selecting the documents to update.
+            update: Update operations.
+
+        Returns:
+            Number of modified documents.
+        """
+
+        result = await self.get_collection(collection).update_many(query, update)
+        return result.modified_count
+
+    async def delete_one(self, collection: str, query: Dict[str, Any]) -> int:
+        """Delete a single document.
+
+        Args:
+            collection: Target collection.
+            query: Filter selecting the document to delete.
+
+        Returns:
+            Number of documents deleted.
+        """
+
+        result = await self.get_collection(collection).delete_one(query)
+        return result.deleted_count
+
+    async def delete_many(self, collection: str, query: Dict[str, Any]) -> int:
+        """Delete many documents matching the query."""
+
+        result = await self.get_collection(collection).delete_many(query)
+        return result.deleted_count
+
+    async def close(self) -> None:
+        """Close the underlying client and its connection pool."""
+
+        await self._client.close()
+
+    @property
+    def db(self):
+        """Return the database handle."""
+        return self._db
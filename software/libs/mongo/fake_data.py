@@ -8,8 +8,8 @@ import pymongo
 MONGO_URI = os.getenv("MONGO_URI", None)
 DB_NAME = os.getenv("MONGO_DB", "plantbox")
 
-client = pymongo.MongoClient(MONGO_URI)
-db = client[DB_NAME]
+# Connected in __main__, so the data curves can be imported without a database
+db = None
 
 def clean_database():
     """Optional: Wipes existing data to start fresh."""
@@ -45,6 +45,37 @@ def create_mock_device():
         upsert=True
     )
 
+def simulated_sensors(moment, start_time):
+    """Sensor readings of a healthy box at `moment`, `start_time` being when its tank was filled."""
+    # --- Simulate Realistic Data Curves ---
+
+    # 1. Light: High during the day (06:00-18:00), 0 at night
+    hour = moment.hour
+    if 6 <= hour < 18:
+        # Peak at noon
+        light_pct = 85 + random.uniform(-5, 5)
+    else:
+        light_pct = 0
+
+    # 2. Temperature: Cooler at night, warmer in day
+    # Sine wave based on hour + some noise
+    base_temp = 22
+    temp_fluctuation = 3 * math.sin((hour - 9) * math.pi / 12)
+    air_temp = base_temp + temp_fluctuation + random.uniform(-0.5, 0.5)
+
+    # 3. Water Level: Slowly decreasing over 24 hours
+    # Starts at 85%, drops by 0.2% per hour
+    hours_passed = (moment - start_time).total_seconds() / 3600
+    water_level = 85.0 - (hours_passed * 0.2)
+
+    return {
+        "air_temp_c": round(air_temp, 1),
+        "light_intensity_pct": round(light_pct, 1),
+        "water_level_pct": round(water_level, 1),
+        "nutrient_a_pct": 92.0, # Static for now
+        "moisture_pct": 55.0
+    }
+
 def generate_telemetry_history():
     print("📈 Generating 24 hours of sensor history...")
     
@@ -55,29 +86,6 @@ def generate_telemetry_history():
     records = []
     
     while current_time <= end_time:
-        # --- Simulate Realistic Data Curves ---
-        
-        # 1. Light: High during the day (06:00-18:00), 0 at night
-        hour = current_time.hour
-        if 6 <= hour < 18:
-            # Peak at noon
-            light_pct = 85 + random.uniform(-5, 5)
-        else:
-            light_pct = 0
-            
-        # 2. Temperature: Cooler at night, warmer in day
-        # Sine wave based on hour + some noise
-        base_temp = 22
-        temp_fluctuation = 3 * math.sin((hour - 9) * math.pi / 12) 
-        air_temp = base_temp + temp_fluctuation + random.uniform(-0.5, 0.5)
-        
-        # 3. Water Level: Slowly decreasing over 24 hours
-        # Starts at 85%, drops by 0.2% per hour
-        hours_passed = (current_time - start_time).total_seconds() / 3600
-        water_level = 85.0 - (hours_passed * 0.2)
-        
-
-
         record = {
             "device_id": "PlantBox-1",
             "received_at": current_time,
@@ -85,13 +93,7 @@ def generate_telemetry_history():
             "metadata": {
                 "profile_active": "basil"
             },
-            "sensors": {
-                "air_temp_c": round(air_temp, 1),
-                "light_intensity_pct": round(light_pct, 1),
-                "water_level_pct": round(water_level, 1),
-                "nutrient_a_pct": 92.0, # Static for now
-                "moisture_pct": 55.0
-            }
+            "sensors": simulated_sensors(current_time, start_time)
         }
         records.append(record)
         
@@ -103,6 +105,7 @@ def generate_telemetry_history():
         print(f"✅ Inserted {len(records)} telemetry records.")
 
 if __name__ == "__main__":
+    db = pymongo.MongoClient(MONGO_URI)[DB_NAME]
     clean_database() # Comment this out if you want to keep old data
     create_mock_device()
     generate_telemetry_history()
@@ -0,0 +1,64 @@
+"""Convert the telemetry collection into a MongoDB time-series collection.
+
+Usage (from ``software/``):
+    python -m libs.mongo.migrate_timeseries --granularity seconds --retention-days 365
+
+The old collection is renamed to ``<collection>_legacy_<timestamp>`` before
+the copy starts. If the copy is interrupted, rerun with that collection to
+resume after the last copied ``_id``:
+    python -m libs.mongo.migrate_timeseries --resume-from telemetry_legacy_20250101120000
+"""
+
+import argparse
+import os
+
+from .storage import MongoConfig, MongoStorage
+
+# --- Configuration ---
+MONGO_URI = os.getenv("MONGO_URI", None)
+DB_NAME = os.getenv("MONGO_DB", "plantbox")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--collection", default="telemetry")
+    parser.add_argument("--granularity", default=os.getenv("TELEMETRY_TS_GRANULARITY", "seconds"),
+                        choices=["seconds", "minutes", "hours"])
+    parser.add_argument("--retention-days", type=float,
+                        default=float(os.getenv("TELEMETRY_RETENTION_DAYS", "0")))
+    parser.add_argument("--chunk-size", type=int, default=5000)
+    parser.add_argument("--resume-from", metavar="LEGACY_COLLECTION",
+                        help="finish an interrupted copy from this legacy collection")
+    args = parser.parse_args()
+
+    if not MONGO_URI:
+        raise SystemExit("MONGO_URI not set")
+
+    storage = MongoStorage(MongoConfig(uri=MONGO_URI, db_name=DB_NAME))
+    retention = int(args.retention_days * 86400) or None
+    if args.resume_from:
+        print(f"⏳ Resuming copy from '{args.resume_from}' into '{args.collection}'...")
+    else:
+        print(f"⏳ Migrating '{args.collection}' to a time-series collection...")
+    copied = storage.migrate_to_timeseries(
+        args.collection,
+        time_field="received_at",
+        meta_field="device_id",
+        granularity=args.granularity,
+        expire_after_seconds=retention,
+        chunk_size=args.chunk_size,
+        source=args.resume_from,
+    )
+    # Same index as the server creates on startup (see build_mongo_storage)
+    storage.get_collection(args.collection).create_index(
+        [("device_id", 1), ("received_at", -1), ("_id", -1)]
+    )
+    print(f"✅ Copied {copied} documents. The old data is kept in a '{args.collection}_legacy_*' collection.")
+    if not copied and not args.resume_from:
+        legacy = sorted(c for c in storage.list_collections() if c.startswith(f"{args.collection}_legacy_"))
+        if legacy:
+            print(f"ℹ️  Already time-series. To finish an interrupted copy, rerun with --resume-from {legacy[-1]}")
+
+
+if __name__ == "__main__":
+    main()
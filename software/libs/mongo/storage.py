@@ -3,10 +3,17 @@
 from __future__ import annotations
 
 from dataclasses import dataclass
-from typing import Any, Dict, Iterable, Optional
+from datetime import datetime
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple, Union
 
-from pymongo import MongoClient
+from pymongo import MongoClient, UpdateOne
 from pymongo.collection import Collection
+from pymongo.command_cursor import CommandCursor
+from pymongo.cursor import Cursor
+from pymongo.errors import OperationFailure
+from pymongo.results import BulkWriteResult
+
+SortSpec = Union[str, Sequence[Tuple[str, int]]]
 
 
 @dataclass
@@ -16,10 +23,49 @@ class MongoConfig:
     Attributes:
         uri: MongoDB connection string.
         db_name: Name of the database to use.
+        max_pool_size: Maximum connections per server in the client pool.
+        min_pool_size: Connections kept open even when idle.
+        max_idle_time_ms: Idle time after which a pooled connection is closed.
+        connect_timeout_ms: Timeout for opening a connection.
+        server_selection_timeout_ms: How long an operation waits for a
+            suitable server before failing.
+        socket_timeout_ms: Timeout for a single network read or write.
+        compressors: Wire compressors in order of preference, e.g.
+            ``"zstd,snappy,zlib"``. ``zstd`` and ``snappy`` need their
+            optional Python packages.
     """
 
     uri: str
     db_name: str
+    max_pool_size: int = 100
+    min_pool_size: int = 0
+    max_idle_time_ms: Optional[int] = None
+    connect_timeout_ms: Optional[int] = None
+    server_selection_timeout_ms: Optional[int] = None
+    socket_timeout_ms: Optional[int] = None
+    compressors: Optional[str] = None
+
+    def client_options(self) -> Dict[str, Any]:
+        """Keyword arguments for ``MongoClient``; unset values keep driver defaults."""
+
+        options: Dict[str, Any] = {
+            "maxPoolSize": self.max_pool_size,
+            "minPoolSize": self.min_pool_size,
+            "maxIdleTimeMS": self.max_idle_time_ms,
+            "connectTimeoutMS": self.connect_timeout_ms,
+            "serverSelectionTimeoutMS": self.server_selection_timeout_ms,
+            "socketTimeoutMS": self.socket_timeout_ms,
+            "compressors": self.compressors,
+        }
+        return {key: value for key, value in options.items() if value is not None}
+
+
+def _sort_spec(sort: Optional[SortSpec]) -> Optional[List[Tuple[str, int]]]:
+    """Normalize a single field name to pymongo's list form (ascending)."""
+
+    if sort is None or not isinstance(sort, str):
+        return sort
+    return [(sort, 1)]
 
 
 class MongoStorage:
@@ -35,7 +81,7 @@ class MongoStorage:
             client: Optional pre-initialized ``MongoClient`` for testing.
         """
 
-        self._client = client or MongoClient(config.uri)
+        self._client = client or MongoClient(config.uri, **config.client_options())
         self._db = self._client[config.db_name]
 
     def get_collection(self, name: str) -> Collection:
@@ -65,6 +111,175 @@ class MongoStorage:
 
         self.get_collection(name).drop()
 
+    def collection_type(self, name: str) -> Optional[str]:
+        """Return ``"collection"``, ``"timeseries"``, ``"view"`` or ``None`` if missing."""
+
+        for info in self._db.list_collections(filter={"name": name}):
+            return info.get("type", "collection")
+        return None
+
+    def create_timeseries_collection(
+        self,
+        name: str,
+        time_field: str,
+        meta_field: Optional[str] = None,
+        granularity: str = "seconds",
+        expire_after_seconds: Optional[int] = None,
+    ) -> None:
+        """Create a time-series collection (MongoDB 5.0+).
+
+        Args:
+            name: Collection to create.
+            time_field: Field holding each measurement's timestamp.
+            meta_field: Field identifying the series, e.g. a device id.
+            granularity: ``"seconds"``, ``"minutes"`` or ``"hours"``.
+            expire_after_seconds: Optional retention; older buckets are deleted.
+        """
+
+        timeseries: Dict[str, Any] = {"timeField": time_field, "granularity": granularity}
+        if meta_field:
+            timeseries["metaField"] = meta_field
+        options: Dict[str, Any] = {"timeseries": timeseries}
+        if expire_after_seconds:
+            options["expireAfterSeconds"] = expire_after_seconds
+        self._db.create_collection(name, **options)
+
+    def set_retention(
+        self, name: str, time_field: str, expire_after_seconds: Optional[int]
+    ) -> None:
+        """Apply a retention period to a collection.
+
+        Time-series collections use their native ``expireAfterSeconds``;
+        regular collections get a TTL index on ``time_field``. ``None`` or
+        ``0`` turns expiry off for time-series collections and leaves
+        regular collections untouched.
+
+        Args:
+            name: Target collection.
+            time_field: Timestamp field used for expiry.
+            expire_after_seconds: Retention in seconds.
+        """
+
+        if self.collection_type(name) == "timeseries":
+            self._db.command(
+                "collMod", name, expireAfterSeconds=expire_after_seconds or "off"
+            )
+            return
+        if not expire_after_seconds:
+            return
+        index_name = f"{time_field}_ttl"
+        try:
+            self.get_collection(name).create_index(
+                [(time_field, 1)], name=index_name, expireAfterSeconds=expire_after_seconds
+            )
+        except OperationFailure:
+            # The TTL index exists with another period; change it in place
+            self._db.command(
+                "collMod",
+                name,
+                index={"name": index_name, "expireAfterSeconds": expire_after_seconds},
+            )
+
+    def migrate_to_timeseries(
+        self,
+        name: str,
+        time_field: str,
+        meta_field: Optional[str] = None,
+        granularity: str = "seconds",
+        expire_after_seconds: Optional[int] = None,
+        chunk_size: int = 5000,
+        source: Optional[str] = None,
+    ) -> int:
+        """Convert a regular collection into a time-series collection.
+
+        The existing collection is renamed to ``<name>_legacy_<timestamp>``,
+        a time-series collection is created under the original name, and
+        documents are copied across in ``_id`` order, ``chunk_size`` at a
+        time. Writers may keep inserting into ``name`` while the copy runs.
+        The legacy collection is kept for the caller to verify and drop.
+
+        A copy that stopped part-way is resumed by passing the legacy
+        collection as ``source``: copying restarts after the newest ``_id``
+        from ``source`` already present in ``name``. Chunks are inserted in
+        order, so everything before that ``_id`` has been copied.
+
+        Args:
+            name: Collection to convert.
+            time_field: Field holding each measurement's timestamp.
+            meta_field: Field identifying the series.
+            granularity: Time-series bucket granularity.
+            expire_after_seconds: Optional retention for the new collection.
+            chunk_size: Documents copied per ``insert_many``.
+            source: Legacy collection of an interrupted migration to resume.
+
+        Returns:
+            Number of documents copied.
+
+        Raises:
+            ValueError: If ``source`` is given but ``name`` is a regular
+                collection.
+        """
+
+        kind = self.collection_type(name)
+        if source is None:
+            if kind == "timeseries":
+                return 0
+            if kind is None:
+                self.create_timeseries_collection(
+                    name, time_field, meta_field, granularity, expire_after_seconds
+                )
+                return 0
+            source = f"{name}_legacy_{datetime.utcnow():%Y%m%d%H%M%S}"
+            self.get_collection(name).rename(source)
+            kind = None
+        if kind is None:
+            self.create_timeseries_collection(
+                name, time_field, meta_field, granularity, expire_after_seconds
+            )
+        elif kind != "timeseries":
+            raise ValueError(f"'{name}' is not a time-series collection; nothing to resume")
+
+        query: Dict[str, Any] = {time_field: {"$type": "date"}}
+        last_id = self._last_copied_id(source, name)
+        if last_id is not None:
+            query["_id"] = {"$gt": last_id}
+
+        target = self.get_collection(name)
+        copied = 0
+        chunk = []
+        cursor = (
+            self.get_collection(source)
+            .find(query)
+            .sort("_id", 1)
+            .batch_size(chunk_size)
+        )
+        for document in cursor:
+            chunk.append(document)
+            if len(chunk) >= chunk_size:
+                target.insert_many(chunk, ordered=True)
+                copied += len(chunk)
+                chunk = []
+        if chunk:
+            target.insert_many(chunk, ordered=True)
+            copied += len(chunk)
+        return copied
+
+    def _last_copied_id(self, source: str, target: str) -> Any:
+        """Newest ``_id`` of ``source`` already in ``target``, or ``None``.
+
+        Documents written to ``target`` after the rename have newer
+        ObjectIds than anything in ``source``, so only ids up to the
+        newest one in ``source`` are considered.
+        """
+
+        newest = self.get_collection(source).find_one({}, {"_id": 1}, sort=[("_id", -1)])
+        if newest is None:
+            return None
+        copied = self.get_collection(target).find_one(
+            {"_id": {"$lte": newest["_id"]}}, {"_id": 1}, sort=[("_id", -1)]
+        )
+        return copied["_id"] if copied else None
+
     def insert_one(self, collection: str, document: Dict[str, Any]) -> str:
         """Insert a single document.
 
@@ -79,28 +294,154 @@ class MongoStorage:
         result = self.get_collection(collection).insert_one(document)
         return str(result.inserted_id)
 
+    def insert_many(
+        self, collection: str, documents: List[Dict[str, Any]], ordered: bool = False
+    ) -> int:
+        """Insert many documents in as few round trips as the driver allows.
+
+        Args:
+            collection: Target collection.
+            documents: Documents to insert; an empty list is a no-op.
+            ordered: Stop at the first failed document instead of
+                attempting the rest.
+
+        Returns:
+            Number of inserted documents.
+        """
+
+        if not documents:
+            return 0
+        result = self.get_collection(collection).insert_many(documents, ordered=ordered)
+        return len(result.inserted_ids)
+
+    def bulk_write(
+        self, collection: str, operations: List[Any], ordered: bool = False
+    ) -> Optional[BulkWriteResult]:
+        """Run mixed write operations (``UpdateOne``, ``InsertOne``...) in one batch.
+
+        Args:
+            collection: Target collection.
+            operations: pymongo write operations; an empty list is a no-op.
+            ordered: Stop at the first failed operation.
+
+        Returns:
+            The driver's result, or ``None`` when there was nothing to write.
+        """
+
+        if not operations:
+            return None
+        return self.get_collection(collection).bulk_write(operations, ordered=ordered)
+
+    def upsert_many(
+        self,
+        collection: str,
+        documents: Iterable[Dict[str, Any]],
+        key: Sequence[str],
+        ordered: bool = False,
+    ) -> int:
+        """Insert or update documents matched on their ``key`` fields.
+
+        Each document is ``$set`` onto the stored one, so fields it does not
+        carry are left unchanged.
+
+        Args:
+            collection: Target collection.
+            documents: Documents to write.
+            key: Fields identifying a document, e.g. ``["hardware_id"]``.
+            ordered: Stop at the first failed write.
+
+        Returns:
+            Number of inserted plus modified documents.
+        """
+
+        operations = [
+            UpdateOne({field: document[field] for field in key}, {"$set": document}, upsert=True)
+            for document in documents
+        ]
+        result = self.bulk_write(collection, operations, ordered=ordered)
+        if result is None:
+            return 0
+        return result.upserted_count + result.modified_count
+
     def find_one(
-        self, collection: str, query: Dict[str, Any]
+        self,
+        collection: str,
+        query: Dict[str, Any],
+        projection: Optional[Dict[str, Any]] = None,
+        sort: Optional[SortSpec] = None,
     ) -> Optional[Dict[str, Any]]:
         """Find a single document matching the query.
 
         Args:
             collection: Target collection.
             query: MongoDB filter query.
+            projection: Fields to include or exclude.
+            sort: Sort key or list of ``(field, direction)`` pairs deciding
+                which match is returned.
 
         Returns:
             The first matching document or ``None``.
         """
 
-        return self.get_collection(collection).find_one(query)
+        return self.get_collection(collection).find_one(
+            query, projection, sort=_sort_spec(sort)
+        )
+
+    def find(
+        self,
+        collection: str,
+        query: Dict[str, Any],
+        projection: Optional[Dict[str, Any]] = None,
+        sort: Optional[SortSpec] = None,
+        limit: int = 0,
+        hint: Optional[Any] = None,
+        batch_size: int = 0,
+    ) -> Cursor:
+        """Return a cursor over documents matching the query.
 
-    def find(self, collection: str, query: Dict[str, Any]) -> Iterable[Dict[str, Any]]:
-        """Yield documents matching the query."""
+        Args:
+            collection: Target collection.
+            query: MongoDB filter query.
+            projection: Fields to include or exclude; trimming large
+                documents saves decoding and network time.
+            sort: Sort key or list of ``(field, direction)`` pairs.
+            limit: Maximum number of documents; ``0`` means no limit.
+            hint: Index name or key pattern the server should use.
+            batch_size: Documents per network round trip; ``0`` keeps the
+                server default.
 
-        return self.get_collection(collection).find(query)
+        Returns:
+            Cursor over the matching documents.
+        """
+
+        return self.get_collection(collection).find(
+            query, projection, sort=_sort_spec(sort), limit=limit, hint=hint, batch_size=batch_size
+        )
+
+    def aggregate(
+        self, collection: str, pipeline: List[Dict[str, Any]], batch_size: Optional[int] = None
+    ) -> CommandCursor:
+        """Run an aggregation pipeline.
+
+        Args:
+            collection: Collection the pipeline starts from.
+            pipeline: Aggregation stages.
+            batch_size: Documents per network round trip; ``None`` keeps the
+                server default.
+
+        Returns:
+            Cursor over the pipeline output.
+        """
+
+        options = {"batchSize": batch_size} if batch_size else {}
+        return self.get_collection(collection).aggregate(pipeline, **options)
 
     def update_one(
-        self, collection: str, query: Dict[str, Any], update: Dict[str, Any]
+        self,
+        collection: str,
+        query: Dict[str, Any],
+        update: Dict[str, Any],
+        upsert: bool = False,
     ) -> int:
         """Update a single document.
 
@@ -108,12 +449,33 @@ class MongoStorage:
             collection: Target collection.
             query: Filter selecting the document to update.
             update: Update operations.
+            upsert: Insert a new document when none matches.
+
+        Returns:
+            Number of modified documents.
+        """
+
+        result = self.get_collection(collection).update_one(query, update, upsert=upsert)
+        return result.modified_count
+
+    def update_many(
+        self,
+        collection: str,
+        query: Dict[str, Any],
+        update: Dict[str, Any],
+    ) -> int:
+        """Update every document matching the query.
+
+        Args:
+            collection: Target collection.
+            query: Filter selecting the documents to update.
+            update: Update operations.
 
         Returns:
             Number of modified documents.
         """
 
-        result = self.get_collection(collection).update_one(query, update)
+        result = self.get_collection(collection).update_many(query, update)
         return result.modified_count
 
     def delete_one(self, collection: str, query: Dict[str, Any]) -> int:
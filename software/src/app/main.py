@@ -3,40 +3,148 @@ from __future__ import annotations
 
 import json
 import os
+import pathlib
 import time as time_lib
-from datetime import datetime, time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, time, timedelta
 from typing import Any, Dict, Tuple, Optional
-from urllib import error, request
 
 import pandas as pd
+import requests
 import streamlit as st
+from requests.adapters import HTTPAdapter
 
 # --- Configuration ---
 DEFAULT_SERVER_URL = os.getenv("PLANTBOX_SERVER_URL", "http://127.0.0.1:8000")
 # We default to the ID used in your seed script
 DEFAULT_DEVICE_ID = os.getenv("PLANTBOX_DEVICE_ID", "PlantBox-6")
 
+# History ranges: label -> (rollup resolution, hours). "Live" charts the raw readings.
+HISTORY_RANGES = {
+    "Live": (None, None),
+    "24h": ("15m", 24),
+    "7d": ("1h", 24 * 7),
+    "30d": ("1h", 24 * 30),
+}
+
+# Data layer: how long fetched data is reused across reruns. Live data
+# (config, latest telemetry, demo state) is short-lived; rollups change slowly.
+LIVE_TTL_S = float(os.getenv("PLANTBOX_LIVE_TTL_S", "5"))
+HISTORY_TTL_S = float(os.getenv("PLANTBOX_HISTORY_TTL_S", "60"))
+REQUEST_TIMEOUT_S = 5
+FETCH_WORKERS = 4
+
+# Raw readings kept in the session for the sensor cards and the Live chart
+TELEMETRY_WINDOW = 50
+
 # --- Helper Functions ---
 
-def api_request(
-    server_url: str, method: str, path: str, payload: Dict[str, Any] | None = None
+@st.cache_resource
+def http_session() -> requests.Session:
+    """Keep-alive connection pool shared by every rerun and browser session."""
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=FETCH_WORKERS, pool_maxsize=FETCH_WORKERS * 2)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+@st.cache_resource
+def fetch_executor() -> ThreadPoolExecutor:
+    return ThreadPoolExecutor(max_workers=FETCH_WORKERS, thread_name_prefix="plantbox-fetch")
+
+def send_request(
+    session: requests.Session, server_url: str, method: str, path: str, payload: Dict[str, Any] | None = None
 ) -> Tuple[bool, Any, str]:
-    """Generic API wrapper."""
+    """Generic API wrapper. Safe to call from worker threads (no Streamlit calls)."""
     url = f"{server_url.rstrip('/')}{path}"
-    headers = {"Content-Type": "application/json"}
-    body = json.dumps(payload).encode("utf-8") if payload else None
-    
-    req = request.Request(url, data=body, headers=headers, method=method)
     try:
-        with request.urlopen(req, timeout=5) as response:
-            raw = response.read().decode("utf-8") or "{}"
-            return True, json.loads(raw), ""
-    except error.HTTPError as exc:
-        raw = exc.read().decode("utf-8") if exc.fp else ""
-        return False, {}, f"HTTP {exc.code}: {raw or exc.reason}"
+        response = session.request(method, url, json=payload or None, timeout=REQUEST_TIMEOUT_S)
+        if not response.ok:
+            return False, {}, f"HTTP {response.status_code}: {response.text or response.reason}"
+        return True, response.json() if response.content else {}, ""
     except Exception as exc:
         return False, {}, str(exc)
 
+def api_request(
+    server_url: str, method: str, path: str, payload: Dict[str, Any] | None = None
+) -> Tuple[bool, Any, str]:
+    ok, data, err = send_request(http_session(), server_url, method, path, payload)
+    if method != "GET":
+        # Writes change what the cached reads would return
+        clear_cached_data()
+    return ok, data, err
+
+@st.cache_data(ttl=LIVE_TTL_S, show_spinner=False)
+def fetch_dashboard(server_url: str, device_id: str, since: Optional[str] = None) -> Dict[str, Tuple[bool, Any, str]]:
+    """
+    Fetches everything the page needs up front, concurrently over the shared
+    pool. Telemetry is only what arrived after ``since`` (oldest first).
+    """
+    telemetry_path = f"/devices/{device_id}/telemetry?limit={TELEMETRY_WINDOW}"
+    if since:
+        telemetry_path += f"&since={since}"
+    paths = {
+        "exists": f"/devices/{device_id}/exists",
+        "config": f"/devices/{device_id}/fetchRefVals",
+        "telemetry": telemetry_path,
+        "demo": f"/devices/{device_id}/demo_control",
+    }
+    session = http_session()
+    futures = {
+        name: fetch_executor().submit(send_request, session, server_url, "GET", path)
+        for name, path in paths.items()
+    }
+    return {name: future.result() for name, future in futures.items()}
+
+@st.cache_data(ttl=HISTORY_TTL_S, show_spinner=False)
+def fetch_rollups(server_url: str, device_id: str, resolution: str, hours: int) -> Tuple[bool, Any, str]:
+    start = (datetime.utcnow() - timedelta(hours=hours)).isoformat()
+    path = f"/devices/{device_id}/telemetry?resolution={resolution}&start={start}&limit=2000"
+    return send_request(http_session(), server_url, "GET", path)
+
+@st.cache_data
+def load_plant_profiles() -> Dict[str, Any]:
+    plants_file = pathlib.Path(__file__).parent / "plants.json"
+    with open(plants_file) as f:
+        return json.load(f)
+
+def clear_cached_data() -> None:
+    fetch_dashboard.clear()
+    fetch_rollups.clear()
+
+def telemetry_frame(records: list) -> pd.DataFrame:
+    """Flattens raw readings into a captured_at-indexed frame with one column per sensor."""
+    df = pd.json_normalize(records)
+    df.columns = [column.removeprefix("sensors.") for column in df.columns]
+    df["time"] = pd.to_datetime(df["captured_at"], format="ISO8601")
+    return df.set_index("time")
+
+def live_telemetry(source: str) -> Tuple[pd.DataFrame, Optional[str]]:
+    """The session's recent readings for ``source`` and the received_at to fetch after."""
+    if st.session_state.get("live_source") != source:
+        st.session_state.live_source = source
+        st.session_state.live_df = pd.DataFrame()
+        st.session_state.live_since = None
+    return st.session_state.live_df, st.session_state.live_since
+
+def append_live_telemetry(records: list) -> pd.DataFrame:
+    """Appends only the new readings and trims the frame to TELEMETRY_WINDOW rows."""
+    frame, since = st.session_state.live_df, st.session_state.live_since
+    if since:
+        records = [r for r in records if r["received_at"] > since]
+    if not records:
+        return frame
+    delta = telemetry_frame(records)
+    if frame.empty or len(records) >= TELEMETRY_WINDOW:
+        # A full delta may have skipped readings, so it replaces the window
+        frame = delta
+    else:
+        frame = pd.concat([frame, delta])
+    frame = frame.sort_index().iloc[-TELEMETRY_WINDOW:]
+    st.session_state.live_df = frame
+    st.session_state.live_since = max(r["received_at"] for r in records)
+    return frame
+
 def parse_time_str(value: str) -> time:
     try:
         return datetime.strptime(value, "%H:%M:%S").time()
@@ -55,21 +163,24 @@ with st.sidebar:
     st.caption(f"Connecting to: {server_url}/devices/{device_id}")
     
     if st.button("Refresh Data"):
+        clear_cached_data()
         st.rerun()
 
-# 2. Check if device is initialized
-exists_path = f"/devices/{device_id}/exists"
-exists_ok, exists_data, exists_err = api_request(server_url, "GET", exists_path)
+# 2. Fetch everything in one concurrent round; failures are not kept in the cache
+live_df, live_since = live_telemetry(f"{server_url}|{device_id}")
+dashboard = fetch_dashboard(server_url, device_id, live_since)
+if not all(ok for ok, _, _ in dashboard.values()):
+    fetch_dashboard.clear()
+
+# Check if device is initialized
+exists_ok, exists_data, exists_err = dashboard["exists"]
 
 if not exists_ok:
     st.error(f"Could not reach server: {exists_err}")
     st.stop()
 
 # Load plant profiles
-import pathlib
-plants_file = pathlib.Path(__file__).parent / "plants.json"
-with open(plants_file) as f:
-    PLANT_PROFILES = json.load(f)
+PLANT_PROFILES = load_plant_profiles()
 
 if not exists_data.get("exists", False):
     # --- Onboarding Screen ---
@@ -130,12 +241,12 @@ if not exists_data.get("exists", False):
     st.stop()
 
 # 3. Fetch Data (device exists — show dashboard)
-fetch_config_path = f"/devices/{device_id}/fetchRefVals"
 update_config_path = f"/devices/{device_id}/config"
-telemetry_path = f"/devices/{device_id}/telemetry?limit=50"
 
-config_ok, device_config, config_err = api_request(server_url, "GET", fetch_config_path)
-telemetry_ok, telemetry_data, telemetry_err = api_request(server_url, "GET", telemetry_path)
+config_ok, device_config, config_err = dashboard["config"]
+telemetry_ok, telemetry_data, telemetry_err = dashboard["telemetry"]
+if telemetry_ok:
+    live_df = append_live_telemetry(telemetry_data)
 
 if not config_ok:
     st.error(f"Could not connect to device. Server says: {config_err}")
@@ -152,12 +263,11 @@ st.markdown(f":{status_color}[● {status_text}]")
 
 
 # 5. Sensor Cards (The "Fresh Data")
-# We get the latest reading from the list (the API returns newest first or last depending on sort)
-# Our API returns newest LAST in the list for graphing, so we take [-1]
-latest = telemetry_data[-1] if (telemetry_ok and telemetry_data) else None
+# The session frame is sorted by capture time, so the newest reading is last
+latest = live_df.iloc[-1].to_dict() if not live_df.empty else None
 
 if latest:
-    sensors = latest.get("sensors", {})
+    sensors = latest
     
     # Top Row: Temp, Light & Schedule
     col1, col2, col3 = st.columns(3)
@@ -192,31 +302,43 @@ else:
     st.warning("No telemetry data received yet.")
 
 # 6. Historical Graphs
-st.subheader("History (24h)")
-if telemetry_ok and telemetry_data:
-    # Flatten the nested "sensors" dict for Pandas
-    flat_data = []
-    for record in telemetry_data:
-        row = {
-            "time": record["captured_at"],
-            **record["sensors"]
-        }
-        flat_data.append(row)
-        
-    df = pd.DataFrame(flat_data)
-    df["time"] = pd.to_datetime(df["time"], format="ISO8601")
-    df = df.set_index("time")
-    
+st.subheader("History")
+history_range = st.radio("Range", list(HISTORY_RANGES), index=1, horizontal=True, label_visibility="collapsed")
+resolution, hours = HISTORY_RANGES[history_range]
+
+df = pd.DataFrame()
+if resolution is None:
+    # Already flattened and time-indexed in the session frame
+    df = live_df
+else:
+    # Pre-aggregated buckets: chart the per-bucket averages
+    rollup_ok, rollup_data, rollup_err = fetch_rollups(server_url, device_id, resolution, hours)
+    if not rollup_ok:
+        fetch_rollups.clear()
+        st.caption(f"History unavailable: {rollup_err}")
+    elif rollup_data:
+        flat_data = []
+        for bucket in rollup_data:
+            row = {"time": bucket["bucket"]}
+            row.update({name: stats["avg"] for name, stats in bucket["sensors"].items()})
+            flat_data.append(row)
+        df = pd.DataFrame(flat_data)
+        df["time"] = pd.to_datetime(df["time"], format="ISO8601")
+        df = df.set_index("time").sort_index()
+
+if not df.empty:
     # Draw charts
     tab1, tab2 = st.tabs(["Environment", "Resources"])
     with tab1:
-        st.line_chart(df[["air_temp_c", "light_intensity_pct"]])
+        st.line_chart(df.reindex(columns=["air_temp_c", "light_intensity_pct"]))
     with tab2:
-        st.line_chart(df[["water_level_pct", "nutrient_a_pct"]])
+        st.line_chart(df.reindex(columns=["water_level_pct", "nutrient_a_pct"]))
+else:
+    st.caption("No history for this range yet.")
 
 # --- Demo Controls ---
 demo_path = f"/devices/{device_id}/demo_control"
-demo_ok, demo_data, demo_err = api_request(server_url, "GET", demo_path)
+demo_ok, demo_data, demo_err = dashboard["demo"]
 demo_state = demo_data if demo_ok else {}
 
 st.subheader("🎛️ Demo Controls")
@@ -264,7 +386,7 @@ if send_email_clicked:
         server_url, "POST", f"/devices/{device_id}/send_email"
     )
     if send_ok:
-        st.toast(f"Email sent to {send_data.get('sent_to', 'owner')}!", icon="📧")
+        st.toast(f"Email queued for {send_data.get('sent_to', 'owner')}!", icon="📧")
         time_lib.sleep(1)
         st.rerun()
     else:
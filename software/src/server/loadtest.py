@@ -0,0 +1,364 @@
+"""Simulated-device load test for the Plantbox API.
+
+Each simulated PlantBox follows the firmware's traffic pattern
+(controls/src/NetworkClient.cpp): telemetry every 10 s as the 8-item
+MessagePack array (power_mw included), and config plus demo_control
+polls every 5 s with If-None-Match. Readings come from the curves in ``libs.mongo.fake_data``.
+
+Usage (from ``software/``):
+    python src/server/loadtest.py --devices 500 --duration 120
+    python src/server/loadtest.py --url http://127.0.0.1:8000 --devices 2000
+    python src/server/loadtest.py --mongo-uri memory --baseline loadtest-old.json
+
+Without --url a server is started on a free port against --mongo-uri, using
+a throwaway database. ``--mongo-uri memory`` runs it on a temporary mongod
+(needs pymongo_inmemory). Results are written as JSON for comparing runs.
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import time as time_lib
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional
+
+import numpy as np
+
+# --- Path Setup ---
+ROOT = Path(__file__).resolve().parents[2]
+if str(ROOT) not in sys.path:
+    sys.path.append(str(ROOT))
+
+from libs.mongo.fake_data import simulated_sensors
+
+# --- Optional Library Imports ---
+try:
+    import httpx
+except ImportError:
+    httpx = None
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+try:
+    import pymongo
+except ImportError:
+    pymongo = None
+
+try:
+    from pymongo_inmemory import Mongod
+except ImportError:
+    Mongod = None
+
+# --- Configuration ---
+MONGO_URI = os.getenv("MONGO_URI", "mongodb://localhost:27017")
+DB_NAME = os.getenv("LOADTEST_MONGO_DB", "plantbox_loadtest")
+
+# Firmware intervals (controls/include/Config.h)
+TELEMETRY_INTERVAL_S = 10.0
+POLL_INTERVAL_S = 5.0
+
+# Order of the compact telemetry array (see COMPACT_TELEMETRY_FIELDS in main.py)
+COMPACT_SENSOR_FIELDS = [
+    "air_temp_c", "humidity_pct", "light_intensity_pct",
+    "water_level_pct", "nutrient_a_pct", "moisture_pct", "power_mw",
+]
+# fake_data has no power curve: the board idles around IDLE_POWER_MW and the
+# grow light adds up to LIGHT_POWER_MW at full intensity
+IDLE_POWER_MW = 600.0
+LIGHT_POWER_MW = 4000.0
+PERCENTILES = (50, 95, 99)
+
+
+class Recorder:
+    """Latency samples and status counts per endpoint, kept after warmup."""
+
+    def __init__(self, warmup_until: float) -> None:
+        self.warmup_until = warmup_until
+        self.latencies: Dict[str, List[float]] = {}
+        self.statuses: Dict[str, Dict[str, int]] = {}
+        self.missed: Dict[str, int] = {}
+
+    def record(self, endpoint: str, started: float, status: str) -> None:
+        if started < self.warmup_until:
+            return
+        self.latencies.setdefault(endpoint, []).append((time_lib.perf_counter() - started) * 1000)
+        counts = self.statuses.setdefault(endpoint, {})
+        counts[status] = counts.get(status, 0) + 1
+
+    def miss(self, endpoint: str) -> None:
+        """A tick skipped because the previous request was still running."""
+        self.missed[endpoint] = self.missed.get(endpoint, 0) + 1
+
+    def summary(self, elapsed_s: float) -> Dict[str, Any]:
+        endpoints = {}
+        for endpoint, samples in sorted(self.latencies.items()):
+            latencies = np.asarray(samples)
+            counts = self.statuses[endpoint]
+            errors = sum(n for status, n in counts.items() if not status.startswith(("2", "3")))
+            endpoints[endpoint] = {
+                "requests": len(samples),
+                "errors": errors,
+                "missed_ticks": self.missed.get(endpoint, 0),
+                "statuses": counts,
+                "throughput_rps": round(len(samples) / elapsed_s, 2) if elapsed_s else 0.0,
+                "latency_ms": {
+                    **{f"p{p}": round(float(np.percentile(latencies, p)), 3) for p in PERCENTILES},
+                    "mean": round(float(latencies.mean()), 3),
+                    "max": round(float(latencies.max()), 3),
+                },
+            }
+        return endpoints
+
+
+def telemetry_request(device_id: str, start_time: datetime, encoding: str) -> Dict[str, Any]:
+    """Request arguments for one reading, encoded like the firmware sends it."""
+    sensors = simulated_sensors(datetime.utcnow(), start_time)
+    sensors["power_mw"] = round(
+        IDLE_POWER_MW + LIGHT_POWER_MW * sensors["light_intensity_pct"] / 100 + random.uniform(-50, 50), 1
+    )
+    if encoding == "msgpack":
+        # Same 8-item array as the firmware; captured_at is left out, the server uses its receive time
+        item = [device_id] + [float(sensors.get(field, 0.0)) for field in COMPACT_SENSOR_FIELDS]
+        return {
+            "content": msgpack.packb(item, use_single_float=True),
+            "headers": {"Content-Type": "application/msgpack"},
+        }
+    return {"json": {"device_id": device_id, "sensors": sensors}}
+
+
+async def call(client, recorder: Recorder, endpoint: str, method: str, url: str, **kwargs) -> Optional[Any]:
+    started = time_lib.perf_counter()
+    try:
+        response = await client.request(method, url, **kwargs)
+    except httpx.HTTPError as exc:
+        recorder.record(endpoint, started, type(exc).__name__)
+        return None
+    recorder.record(endpoint, started, str(response.status_code))
+    return response
+
+
+async def every(interval_s: float, offset_s: float, stop_at: float, recorder: Recorder, endpoint: str, action) -> None:
+    """Runs ``action`` on a fixed schedule; like the firmware's millis() checks,
+    a tick that falls due while the previous request is running is skipped."""
+    loop = asyncio.get_running_loop()
+    due = loop.time() + offset_s
+    while due < stop_at:
+        await asyncio.sleep(max(0.0, due - loop.time()))
+        await action()
+        due += interval_s
+        while due < loop.time():
+            recorder.miss(endpoint)
+            due += interval_s
+
+
+async def run_device(client, device_id: str, args, recorder: Recorder, stop_at: float) -> None:
+    # Boxes were filled at different times, so their curves do not move in lockstep
+    start_time = datetime.utcnow() - timedelta(hours=random.uniform(0, 48))
+    etags: Dict[str, str] = {}
+
+    async def poll(endpoint: str, path: str) -> None:
+        headers = {"If-None-Match": etags[endpoint]} if endpoint in etags else {}
+        response = await call(client, recorder, endpoint, "GET", path, headers=headers)
+        if response is not None and response.status_code == 200 and "etag" in response.headers:
+            etags[endpoint] = response.headers["etag"]
+
+    async def send_telemetry() -> None:
+        await call(
+            client, recorder, "sendTelemetry", "POST", "/sendTelemetry",
+            **telemetry_request(device_id, start_time, args.encoding),
+        )
+
+    # Devices power up at random moments within one interval
+    await asyncio.gather(
+        every(TELEMETRY_INTERVAL_S, random.uniform(0, TELEMETRY_INTERVAL_S), stop_at, recorder,
+              "sendTelemetry", send_telemetry),
+        every(POLL_INTERVAL_S, random.uniform(0, POLL_INTERVAL_S), stop_at, recorder,
+              "fetchRefVals", lambda: poll("fetchRefVals", f"/devices/{device_id}/fetchRefVals")),
+        every(POLL_INTERVAL_S, random.uniform(0, POLL_INTERVAL_S), stop_at, recorder,
+              "demo_control", lambda: poll("demo_control", f"/devices/{device_id}/demo_control")),
+    )
+
+
+async def run_load(base_url: str, args) -> Dict[str, Any]:
+    # Real boxes open a new connection per request unless --keep-alive is set
+    limits = httpx.Limits(
+        max_connections=args.max_connections,
+        max_keepalive_connections=None if args.keep_alive else 0,
+    )
+    async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=args.timeout) as client:
+        loop = asyncio.get_running_loop()
+        started = loop.time()
+        stop_at = started + args.warmup + args.duration
+        recorder = Recorder(time_lib.perf_counter() + args.warmup)
+        await asyncio.gather(*(
+            run_device(client, f"{args.prefix}-{i}", args, recorder, stop_at)
+            for i in range(args.devices)
+        ))
+        elapsed_s = loop.time() - started - args.warmup
+
+        stats = None
+        try:
+            stats = (await client.get("/stats")).json()
+        except Exception:
+            pass
+
+    endpoints = recorder.summary(elapsed_s)
+    return {
+        "elapsed_s": round(elapsed_s, 3),
+        "throughput_rps": round(sum(e["throughput_rps"] for e in endpoints.values()), 2),
+        "expected_rps": round(args.devices * (1 / TELEMETRY_INTERVAL_S + 2 / POLL_INTERVAL_S), 2),
+        "endpoints": endpoints,
+        "server_stats": stats,
+    }
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+@contextmanager
+def mongo_uri(uri: str) -> Iterator[str]:
+    """Yields a usable Mongo URI, starting a temporary mongod for ``memory``."""
+    if uri != "memory":
+        yield uri
+        return
+    if Mongod is None:
+        raise SystemExit("--mongo-uri memory needs pymongo_inmemory (pip install pymongo_inmemory)")
+    with Mongod() as mongod:
+        yield mongod.connection_string
+
+
+@contextmanager
+def local_server(uri: str) -> Iterator[str]:
+    """Starts the API with uvicorn against a fresh database and yields its URL."""
+    if pymongo is not None:
+        try:
+            pymongo.MongoClient(uri, serverSelectionTimeoutMS=5000).drop_database(DB_NAME)
+        except pymongo.errors.PyMongoError as exc:
+            raise SystemExit(f"Cannot reach Mongo at {uri}: {exc}")
+
+    port = free_port()
+    # No SMTP server, so alerts raised under load never send real email
+    env = {**os.environ, "MONGO_URI": uri, "MONGO_DB": DB_NAME, "SMTP_SERVER": ""}
+    process = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--host", "127.0.0.1", "--port", str(port),
+         "--log-level", "warning", "--no-access-log"],
+        cwd=Path(__file__).resolve().parent,
+        env=env,
+    )
+    url = f"http://127.0.0.1:{port}"
+    try:
+        deadline = time_lib.monotonic() + 60
+        while True:
+            if process.poll() is not None:
+                raise SystemExit(f"Server exited with code {process.returncode}")
+            try:
+                if httpx.get(f"{url}/health", timeout=1).status_code == 200:
+                    break
+            except httpx.HTTPError:
+                pass
+            if time_lib.monotonic() > deadline:
+                raise SystemExit("Server did not become healthy within 60 s")
+            time_lib.sleep(0.2)
+        yield url
+    finally:
+        process.terminate()
+        try:
+            process.wait(timeout=30)
+        except subprocess.TimeoutExpired:
+            process.kill()
+
+
+def print_report(result: Dict[str, Any], baseline: Optional[Dict[str, Any]]) -> None:
+    print(f"\n{result['config']['devices']} devices, {result['elapsed_s']} s measured: "
+          f"{result['throughput_rps']} req/s (expected {result['expected_rps']})")
+    header = f"{'endpoint':<15}{'requests':>10}{'errors':>8}{'missed':>8}{'req/s':>9}"
+    header += "".join(f"{f'p{p} ms':>10}" for p in PERCENTILES)
+    print(header)
+    for endpoint, summary in result["endpoints"].items():
+        latency = summary["latency_ms"]
+        row = (f"{endpoint:<15}{summary['requests']:>10}{summary['errors']:>8}"
+               f"{summary['missed_ticks']:>8}{summary['throughput_rps']:>9}")
+        row += "".join(f"{latency[f'p{p}']:>10.1f}" for p in PERCENTILES)
+        print(row)
+        previous = (baseline or {}).get("endpoints", {}).get(endpoint)
+        if previous:
+            deltas = []
+            for p in PERCENTILES:
+                before = previous["latency_ms"][f"p{p}"]
+                change = (latency[f"p{p}"] - before) / before * 100 if before else 0.0
+                deltas.append(f"p{p} {change:+.1f}%")
+            print(f"{'':<15}vs baseline: " + ", ".join(deltas))
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--devices", type=int, default=100)
+    parser.add_argument("--duration", type=float, default=60.0, help="measured seconds, after warmup")
+    parser.add_argument("--warmup", type=float, default=TELEMETRY_INTERVAL_S)
+    parser.add_argument("--url", help="drive an already running server instead of starting one")
+    parser.add_argument("--mongo-uri", default=MONGO_URI, help="Mongo for the started server, or 'memory'")
+    parser.add_argument("--encoding", choices=["msgpack", "json"], default="msgpack")
+    parser.add_argument("--prefix", default="LoadBox", help="device id prefix")
+    parser.add_argument("--keep-alive", action="store_true", help="reuse connections between requests")
+    parser.add_argument("--max-connections", type=int, default=1000)
+    parser.add_argument("--timeout", type=float, default=30.0)
+    parser.add_argument("--seed", type=int)
+    parser.add_argument("--output", help="result JSON path (default: loadtest-<timestamp>.json)")
+    parser.add_argument("--baseline", help="earlier result JSON to compare latencies against")
+    args = parser.parse_args()
+
+    if httpx is None:
+        raise SystemExit("The load test needs httpx (pip install httpx)")
+    if args.encoding == "msgpack" and msgpack is None:
+        raise SystemExit("--encoding msgpack needs msgpack (pip install msgpack)")
+    if args.seed is not None:
+        random.seed(args.seed)
+
+    print(f"⏳ Simulating {args.devices} devices for {args.warmup:g} s warmup + {args.duration:g} s...")
+    if args.url:
+        result = asyncio.run(run_load(args.url.rstrip("/"), args))
+    else:
+        with mongo_uri(args.mongo_uri) as uri, local_server(uri) as url:
+            result = asyncio.run(run_load(url, args))
+
+    result = {
+        "created_at": datetime.utcnow().isoformat(),
+        "config": {
+            "devices": args.devices,
+            "duration_s": args.duration,
+            "warmup_s": args.warmup,
+            "encoding": args.encoding,
+            "keep_alive": args.keep_alive,
+            "target": args.url or ("memory" if args.mongo_uri == "memory" else "local"),
+            "telemetry_interval_s": TELEMETRY_INTERVAL_S,
+            "poll_interval_s": POLL_INTERVAL_S,
+        },
+        **result,
+    }
+    baseline = None
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+    print_report(result, baseline)
+
+    output = args.output or f"loadtest-{datetime.utcnow():%Y%m%dT%H%M%S}.json"
+    with open(output, "w") as f:
+        json.dump(result, f, indent=2)
+    print(f"✅ Results written to {output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,17 +1,31 @@
 # uvicorn main:app --host 0.0.0.0 --port 8000
 from __future__ import annotations
 
+import asyncio
+import base64
+import csv
+import io
+import json
 import logging
 import os
+import queue
 import sys
-from collections import deque
+import threading
+import time as time_lib
+import zlib
+from collections import OrderedDict, deque
+from contextlib import asynccontextmanager
 from datetime import datetime, time, timedelta
 from pathlib import Path
-from typing import Deque, Dict, List, Optional, Any
+from typing import AsyncIterator, Deque, Dict, Iterable, List, NamedTuple, Optional, Any, Tuple, Union
 from uuid import uuid4
 
-from fastapi import FastAPI, HTTPException, Header, Depends
-from pydantic import BaseModel, Field
+import numpy as np
+from fastapi import FastAPI, HTTPException, Header, Depends, Request, Response
+from fastapi.concurrency import run_in_threadpool
+from fastapi.exceptions import RequestValidationError
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel, Field, ValidationError
 
 import dotenv
 dotenv.load_dotenv()
@@ -29,15 +43,65 @@ except Exception:
     EmailClient = None
     EmailConfig = None
 
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+try:
+    import cbor2
+except ImportError:
+    cbor2 = None
+
 try:
     from libs.mongo.storage import MongoConfig, MongoStorage
+    from libs.mongo.async_storage import AsyncMongoStorage
+    from bson import ObjectId
+    from pymongo import UpdateOne
+    from pymongo.errors import BulkWriteError, DuplicateKeyError
 except Exception as exc:
     MongoConfig = None
     MongoStorage = None
+    AsyncMongoStorage = None
+    ObjectId = None
+    UpdateOne = None
+    BulkWriteError = None
+    DuplicateKeyError = None
 
 logging.basicConfig(level=logging.INFO)
 
-app = FastAPI(title="Plantbox API", version="0.2.1")
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Opens the async Mongo client, starts background workers and drains them on shutdown."""
+    global ASYNC_MONGO_STORAGE
+    ASYNC_MONGO_STORAGE = build_async_mongo_storage()
+    if TELEMETRY_WRITER:
+        TELEMETRY_WRITER.start()
+    PRESENCE.start()
+    await PRESENCE_SWEEPER.start()
+    if EMAIL_DISPATCHER:
+        EMAIL_DISPATCHER.start()
+    yield
+    await PRESENCE_SWEEPER.stop()
+    if EMAIL_DISPATCHER:
+        EMAIL_DISPATCHER.stop()
+    if EMAIL_SETTINGS:
+        EMAIL_SETTINGS["client"].close()
+    PRESENCE.stop()
+    if TELEMETRY_WRITER:
+        TELEMETRY_WRITER.stop()
+    if ASYNC_MONGO_STORAGE:
+        await ASYNC_MONGO_STORAGE.close()
+        ASYNC_MONGO_STORAGE = None
+
+
+app = FastAPI(title="Plantbox API", version="0.2.1", lifespan=lifespan)
 
 # --- Default/Fallback Data ---
 DEFAULT_TARGETS = {
@@ -45,6 +109,122 @@ DEFAULT_TARGETS = {
     "water_level": {"min": 50.0, "max": 100.0},
 }
 
+# Upper bound on readings accepted by a single /sendTelemetryBatch call
+TELEMETRY_BATCH_MAX = int(os.getenv("TELEMETRY_BATCH_MAX", "1000"))
+
+# Telemetry wire formats, chosen by Content-Type. Besides the JSON-shaped
+# map, a reading may be sent as a positional array in this order; trailing
+# fields may be left out (captured_at is epoch seconds, UTC).
+COMPACT_TELEMETRY_FIELDS = [
+    "device_id", "air_temp_c", "humidity_pct", "light_intensity_pct", "water_level_pct",
+    "nutrient_a_pct", "moisture_pct", "power_mw", "captured_at",
+]
+COMPACT_TELEMETRY_MIN_FIELDS = 7
+MSGPACK_CONTENT_TYPES = {"application/msgpack", "application/x-msgpack", "application/vnd.msgpack"}
+CBOR_CONTENT_TYPES = {"application/cbor"}
+
+# Write-behind telemetry buffer (opt-in)
+TELEMETRY_WRITE_BEHIND = os.getenv("TELEMETRY_WRITE_BEHIND", "false").lower() == "true"
+TELEMETRY_FLUSH_SIZE = int(os.getenv("TELEMETRY_FLUSH_SIZE", "500"))
+TELEMETRY_FLUSH_INTERVAL_S = float(os.getenv("TELEMETRY_FLUSH_INTERVAL_S", "2.0"))
+TELEMETRY_BUFFER_MAX = int(os.getenv("TELEMETRY_BUFFER_MAX", "10000"))
+TELEMETRY_BUFFER_PUT_TIMEOUT_S = float(os.getenv("TELEMETRY_BUFFER_PUT_TIMEOUT_S", "1.0"))
+DUPLICATE_KEY_ERROR = 11000  # Mongo E11000
+
+# Heartbeats are coalesced in memory and flushed on this interval
+PRESENCE_FLUSH_INTERVAL_S = float(os.getenv("PRESENCE_FLUSH_INTERVAL_S", "5.0"))
+ONLINE_WINDOW = timedelta(minutes=2)
+# Devices silent for ONLINE_WINDOW are marked offline on this interval
+PRESENCE_SWEEP_INTERVAL_S = float(os.getenv("PRESENCE_SWEEP_INTERVAL_S", "15"))
+
+# Outbound email dispatch
+EMAIL_WORKERS = int(os.getenv("EMAIL_WORKERS", "2"))
+EMAIL_QUEUE_MAX = int(os.getenv("EMAIL_QUEUE_MAX", "1000"))
+EMAIL_MAX_ATTEMPTS = int(os.getenv("EMAIL_MAX_ATTEMPTS", "4"))
+EMAIL_RETRY_BASE_S = float(os.getenv("EMAIL_RETRY_BASE_S", "2.0"))
+EMAIL_SHUTDOWN_TIMEOUT_S = float(os.getenv("EMAIL_SHUTDOWN_TIMEOUT_S", "10.0"))
+# Status emails: one per device per cooldown. A queued email holds the slot
+# until it is sent or dead-lettered, or for at most EMAIL_PENDING_TTL_S if the
+# server dies first.
+STATUS_EMAIL_COOLDOWN = timedelta(hours=24)
+EMAIL_PENDING_TTL_S = float(os.getenv("EMAIL_PENDING_TTL_S", "3600"))
+
+# Alert state machine: a firing alert resolves only once the value is back
+# inside the target shrunk by this % of its width (unless the target sets
+# its own absolute hysteresis), and is re-notified at most this often.
+ALERT_HYSTERESIS_PCT = float(os.getenv("ALERT_HYSTERESIS_PCT", "5"))
+ALERT_RENOTIFY_S = float(os.getenv("ALERT_RENOTIFY_S", "3600"))
+
+# Upper bound on stored readings re-evaluated by /alerts/recheck
+ALERT_RECHECK_MAX_READINGS = int(os.getenv("ALERT_RECHECK_MAX_READINGS", "100000"))
+
+# Hot telemetry cache: a ring buffer per device under a global record budget
+TELEMETRY_CACHE_PER_DEVICE = int(os.getenv("TELEMETRY_CACHE_PER_DEVICE", "500"))
+TELEMETRY_CACHE_MAX_RECORDS = int(os.getenv("TELEMETRY_CACHE_MAX_RECORDS", "100000"))
+
+# Pre-aggregated telemetry rollups: resolution -> bucket size in seconds
+TELEMETRY_ROLLUPS = os.getenv("TELEMETRY_ROLLUPS", "true").lower() != "false"
+ROLLUP_RESOLUTIONS = {"1m": 60, "15m": 15 * 60, "1h": 60 * 60}
+ROLLUP_MAX_POINTS = int(os.getenv("ROLLUP_MAX_POINTS", "2000"))
+
+# Telemetry storage layout: native time-series collection (MongoDB 5.0+,
+# opt-in) and retention. Existing regular collections are converted with
+# `python -m libs.mongo.migrate_timeseries`.
+TELEMETRY_TIMESERIES = os.getenv("TELEMETRY_TIMESERIES", "false").lower() == "true"
+TELEMETRY_TS_GRANULARITY = os.getenv("TELEMETRY_TS_GRANULARITY", "seconds")
+TELEMETRY_RETENTION_DAYS = float(os.getenv("TELEMETRY_RETENTION_DAYS", "0"))
+
+# Streaming export
+EXPORT_BATCH_SIZE = int(os.getenv("EXPORT_BATCH_SIZE", "2000"))
+EXPORT_CHUNK_BYTES = 64 * 1024
+
+# Parsed DeviceConfig cache
+DEVICE_CONFIG_CACHE_SIZE = int(os.getenv("DEVICE_CONFIG_CACHE_SIZE", "4096"))
+DEVICE_CONFIG_CACHE_TTL_S = float(os.getenv("DEVICE_CONFIG_CACHE_TTL_S", "30"))
+
+# ETags for device polling: known versions are trusted for this long, which
+# bounds staleness from writes made by other server processes
+ETAG_TTL_S = float(os.getenv("ETAG_TTL_S", "60"))
+
+# demo_control push: longest ?wait= a long-poll may hold, and how often an
+# idle SSE stream sends a keepalive comment
+DEMO_CONTROL_MAX_WAIT_S = float(os.getenv("DEMO_CONTROL_MAX_WAIT_S", "30"))
+DEMO_CONTROL_SSE_KEEPALIVE_S = float(os.getenv("DEMO_CONTROL_SSE_KEEPALIVE_S", "15"))
+
+# Fleet summary (GET /devices): pages are cached this long per query
+FLEET_CACHE_TTL_S = float(os.getenv("FLEET_CACHE_TTL_S", "5"))
+FLEET_CACHE_SIZE = int(os.getenv("FLEET_CACHE_SIZE", "256"))
+FLEET_PAGE_MAX = int(os.getenv("FLEET_PAGE_MAX", "1000"))
+
+# Alert rules: target key -> SensorReadings field it constrains. Targets may
+# also be keyed by the field name itself (e.g. "moisture_pct").
+TARGET_SENSOR_FIELDS = {
+    "air_temp": "air_temp_c",
+    "humidity": "humidity_pct",
+    "light_intensity": "light_intensity_pct",
+    "water_level": "water_level_pct",
+    "nutrient_a": "nutrient_a_pct",
+    "moisture": "moisture_pct",
+    "power": "power_mw",
+}
+SENSOR_LABELS = {
+    "air_temp_c": ("Temp", "°C"),
+    "humidity_pct": ("Humidity", "%"),
+    "light_intensity_pct": ("Light intensity", "%"),
+    "water_level_pct": ("Water level", "%"),
+    "nutrient_a_pct": ("Nutrient A", "%"),
+    "moisture_pct": ("Moisture", "%"),
+    "power_mw": ("Power", "mW"),
+}
+SENSOR_COLUMNS = list(SENSOR_LABELS)
+# Sensors whose firmware sends a negative sentinel (-1) when there is no
+# reading; INA219 noise near zero load can also dip slightly below zero
+NO_READING_BELOW_ZERO = ("water_level_pct", "power_mw")
+
+# Fields served by the raw telemetry read path (matches TelemetryRecord)
+TELEMETRY_PROJECTION = {"_id": 0, "device_id": 1, "sensors": 1, "captured_at": 1, "received_at": 1, "metadata": 1}
+TELEMETRY_PROJECTION_WITH_ID = {**TELEMETRY_PROJECTION, "_id": 1}
+
 # --- Pydantic Models ---
 
 class LightSchedule(BaseModel):
@@ -54,6 +234,7 @@ class LightSchedule(BaseModel):
 class TargetRange(BaseModel):
     min: float
     max: float
+    hysteresis: Optional[float] = None  # absolute band, overrides ALERT_HYSTERESIS_PCT
 
 
 # Replaces the old ConfigState to match the new UI/DB schema
@@ -85,6 +266,7 @@ class SensorReadings(BaseModel):
     water_level_pct: float = Field(..., ge=-1, le=100, description="Water Level in Reservoir (-1 = no reading)")
     nutrient_a_pct: float = Field(..., ge=0, le=100, description="Nutrient Tank A Level")
     moisture_pct: float = Field(..., ge=0, le=100, description="Moisture Sensor Level")
+    power_mw: Optional[float] = Field(None, description="Power draw in milliwatts (negative = no reading)")
 
 class TelemetryIn(BaseModel):
     device_id: str
@@ -95,6 +277,22 @@ class TelemetryRecord(TelemetryIn):
     received_at: datetime
     metadata: Dict[str, Any] = {} 
 
+class TelemetryBatchIn(BaseModel):
+    readings: List[TelemetryIn]
+
+class SensorStats(BaseModel):
+    min: float
+    max: float
+    avg: float
+    count: int
+
+class TelemetryRollup(BaseModel):
+    device_id: str
+    resolution: str
+    bucket: datetime
+    count: int
+    sensors: Dict[str, SensorStats] = {}
+
 class DemoControl(BaseModel):
     hardware_id: str
     demo_enabled: bool = False
@@ -114,6 +312,39 @@ class Notification(BaseModel):
     created_at: datetime
     device_id: str
 
+class DeviceSyncIn(BaseModel):
+    sensors: Optional[SensorReadings] = None
+    captured_at: Optional[datetime] = None
+
+class DeviceSyncOut(BaseModel):
+    hardware_id: str
+    targets: Dict[str, TargetRange]
+    light_schedule: LightSchedule
+    demo_control: DemoControl
+    alerts: List[str] = []
+
+class FleetDevice(BaseModel):
+    hardware_id: str
+    display_name: Optional[str] = None  # None when the device has no stored config
+    owner_id: Optional[str] = None
+    plant_type: Optional[str] = None
+    is_online: bool
+    last_seen: Optional[datetime] = None
+    sensors: Optional[SensorReadings] = None  # latest reading
+    captured_at: Optional[datetime] = None
+    received_at: Optional[datetime] = None
+
+class EmailJob(BaseModel):
+    id: str
+    status: str = "queued"  # queued -> sending -> sent | retrying | dead_lettered
+    subject: str
+    to: List[str]
+    device_id: Optional[str] = None
+    attempts: int = 0
+    last_error: Optional[str] = None
+    created_at: datetime = Field(default_factory=datetime.utcnow)
+    updated_at: datetime = Field(default_factory=datetime.utcnow)
+
 # --- Helper Functions ---
 
 def model_to_dict(model: BaseModel) -> Dict[str, object]:
@@ -121,6 +352,107 @@ def model_to_dict(model: BaseModel) -> Dict[str, object]:
         return model.model_dump()
     return model.dict()
 
+def json_default(value: Any) -> Any:
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return str(value)
+
+def raw_json_response(content: Any) -> Response:
+    """
+    Encodes plain documents straight to JSON, skipping response_model
+    validation. Only use for documents already written in a model's shape.
+    """
+    if orjson is not None:
+        body = orjson.dumps(content, default=json_default)
+    else:
+        body = json.dumps(content, default=json_default, separators=(",", ":")).encode("utf-8")
+    return Response(content=body, media_type="application/json")
+
+def decode_wire_body(content_type: str, body: bytes) -> Any:
+    """Decodes a request body by media type: JSON, MessagePack or CBOR."""
+    if content_type in MSGPACK_CONTENT_TYPES:
+        if msgpack is None:
+            raise HTTPException(status_code=415, detail="MessagePack is not supported by this server.")
+        return msgpack.unpackb(body, raw=False, timestamp=3)
+    if content_type in CBOR_CONTENT_TYPES:
+        if cbor2 is None:
+            raise HTTPException(status_code=415, detail="CBOR is not supported by this server.")
+        return cbor2.loads(body)
+    if content_type == "application/json" or content_type.endswith("+json"):
+        return orjson.loads(body) if orjson is not None else json.loads(body)
+    raise HTTPException(
+        status_code=415,
+        detail="Content-Type must be application/json, application/msgpack or application/cbor",
+    )
+
+async def read_wire_body(request: Request) -> Any:
+    content_type = request.headers.get("content-type", "application/json").split(";")[0].strip().lower()
+    body = await request.body()
+    try:
+        return decode_wire_body(content_type, body)
+    except HTTPException:
+        raise
+    except Exception:
+        raise HTTPException(status_code=400, detail=f"Malformed {content_type} body")
+
+def parse_telemetry(item: Any) -> TelemetryIn:
+    """Builds a TelemetryIn from a decoded map or compact positional array."""
+    if isinstance(item, (list, tuple)):
+        if not COMPACT_TELEMETRY_MIN_FIELDS <= len(item) <= len(COMPACT_TELEMETRY_FIELDS):
+            raise RequestValidationError([{
+                "loc": ("body",),
+                "msg": f"Compact reading needs {COMPACT_TELEMETRY_MIN_FIELDS}-{len(COMPACT_TELEMETRY_FIELDS)} fields",
+                "type": "value_error",
+            }])
+        sensors = dict(zip(COMPACT_TELEMETRY_FIELDS, item))
+        device_id = sensors.pop("device_id")
+        captured_at = sensors.pop("captured_at", None)
+        # Devices pack float32; trim the binary noise so 24.3 is stored as 24.3.
+        # Only sensor values: a float epoch in captured_at needs every digit.
+        sensors = {
+            name: float(f"{value:.7g}") if isinstance(value, float) else value
+            for name, value in sensors.items()
+        }
+        item = {"device_id": device_id, "sensors": sensors}
+        if isinstance(captured_at, (int, float)):
+            try:
+                item["captured_at"] = datetime.utcfromtimestamp(captured_at)
+            except (ValueError, OverflowError, OSError):
+                raise RequestValidationError([{
+                    "loc": ("body", "captured_at"),
+                    "msg": "captured_at is not a valid epoch timestamp",
+                    "type": "value_error",
+                }])
+        elif captured_at is not None:
+            item["captured_at"] = captured_at
+    if not isinstance(item, dict):
+        raise RequestValidationError([{"loc": ("body",), "msg": "Expected a reading", "type": "type_error"}])
+    try:
+        return TelemetryIn(**item)
+    except ValidationError as exc:
+        raise RequestValidationError([{**error, "loc": ("body", *error["loc"])} for error in exc.errors()])
+
+async def telemetry_body(request: Request) -> TelemetryIn:
+    return parse_telemetry(await read_wire_body(request))
+
+async def telemetry_batch_body(request: Request) -> TelemetryBatchIn:
+    """Accepts {"readings": [...]} or a bare list; each reading may be a map or compact array."""
+    payload = await read_wire_body(request)
+    readings = payload.get("readings") if isinstance(payload, dict) else payload
+    if not isinstance(readings, list):
+        raise RequestValidationError([{"loc": ("body", "readings"), "msg": "Expected a list", "type": "list_type"}])
+    if len(readings) > TELEMETRY_BATCH_MAX:
+        raise HTTPException(
+            status_code=413,
+            detail=f"Batch too large ({len(readings)} > {TELEMETRY_BATCH_MAX} readings)",
+        )
+    return TelemetryBatchIn(readings=[parse_telemetry(item) for item in readings])
+
+def copy_model(model: BaseModel, **update: Any) -> BaseModel:
+    if hasattr(model, "model_copy"):
+        return model.model_copy(update=update)
+    return model.copy(update=update)
+
 def load_email_settings() -> Optional[Dict[str, object]]:
     if EmailClient is None or EmailConfig is None:
         return None
@@ -140,9 +472,29 @@ def load_email_settings() -> Optional[Dict[str, object]]:
         username=username,
         password=password,
         use_tls=os.getenv("SMTP_USE_TLS", "true").lower() != "false",
+        pool_size=int(os.getenv("SMTP_POOL_SIZE", "2")),
+        idle_timeout=float(os.getenv("SMTP_IDLE_TIMEOUT_S", "60")),
     )
     return {"client": EmailClient(config), "from_email": from_email, "to": recipients}
 
+def optional_int_env(name: str) -> Optional[int]:
+    value = os.getenv(name)
+    return int(value) if value else None
+
+def load_mongo_config(uri: str) -> MongoConfig:
+    """Connection and pool settings shared by the sync and async clients."""
+    return MongoConfig(
+        uri=uri,
+        db_name=os.getenv("MONGO_DB", "plantbox"),
+        max_pool_size=int(os.getenv("MONGO_MAX_POOL_SIZE", "100")),
+        min_pool_size=int(os.getenv("MONGO_MIN_POOL_SIZE", "0")),
+        max_idle_time_ms=optional_int_env("MONGO_MAX_IDLE_TIME_MS"),
+        connect_timeout_ms=optional_int_env("MONGO_CONNECT_TIMEOUT_MS"),
+        server_selection_timeout_ms=optional_int_env("MONGO_SERVER_SELECTION_TIMEOUT_MS"),
+        socket_timeout_ms=optional_int_env("MONGO_SOCKET_TIMEOUT_MS"),
+        compressors=os.getenv("MONGO_COMPRESSORS") or None,
+    )
+
 def build_mongo_storage() -> Optional[MongoStorage]:
     if MongoStorage is None or MongoConfig is None:
         return None
@@ -150,69 +502,576 @@ def build_mongo_storage() -> Optional[MongoStorage]:
     if not uri:
         sys.exit("MONGO_URI not set")
         return None
-    db_name = os.getenv("MONGO_DB", "plantbox")
     try:
-        storage = MongoStorage(MongoConfig(uri=uri, db_name=db_name))
+        storage = MongoStorage(load_mongo_config(uri))
+        try:
+            setup_telemetry_collection(storage)
+        except Exception as exc:
+            logging.warning("Telemetry collection setup skipped: %s", exc)
         # Create indexes for performance
-        storage.db["telemetry"].create_index([("device_id", 1), ("received_at", -1)])
+        # Serves raw pages, which sort on (received_at, _id) for the cursor tie-break,
+        # and every (device_id, received_at) query through its prefix
+        try:
+            storage.db["telemetry"].create_index([("device_id", 1), ("received_at", -1), ("_id", -1)])
+        except Exception as exc:
+            # Older servers reject _id in a time-series index; keep the two-field one
+            logging.warning("Telemetry (device_id, received_at, _id) index not created: %s", exc)
+            storage.db["telemetry"].create_index([("device_id", 1), ("received_at", -1)])
+        else:
+            try:
+                storage.db["telemetry"].drop_index("device_id_1_received_at_-1")
+            except Exception:
+                pass  # already dropped
         storage.db["devices"].create_index([("hardware_id", 1)], unique=True)
+        storage.db["devices"].create_index([("is_online", 1), ("last_seen", 1)])
+        # One demo_control doc per device, so the status-email slot has one owner
+        try:
+            storage.db["demo_control"].create_index([("hardware_id", 1)], unique=True)
+        except Exception as exc:
+            logging.warning("demo_control unique hardware_id index not created (duplicate docs?): %s", exc)
+        for resolution in ROLLUP_RESOLUTIONS:
+            storage.db[rollup_collection(resolution)].create_index(
+                [("device_id", 1), ("bucket", -1)], unique=True
+            )
         logging.info("Connected to Mongo")
         return storage
     except Exception as exc:
         logging.warning("Mongo disabled/failed: %s", exc)
         return None
 
+def build_async_mongo_storage() -> Optional[AsyncMongoStorage]:
+    """
+    Client for the request path. It is bound to the running event loop, so it
+    is created in the lifespan; indexes were already set up by the sync client.
+    """
+    if MONGO_STORAGE is None or AsyncMongoStorage is None:
+        return None
+    try:
+        return AsyncMongoStorage(load_mongo_config(os.getenv("MONGO_URI")))
+    except Exception as exc:
+        logging.warning("Async Mongo disabled/failed: %s", exc)
+        return None
+
+# Whether the telemetry collection actually is time-series (set on startup)
+TELEMETRY_IS_TIMESERIES = False
+
+def setup_telemetry_collection(storage: MongoStorage):
+    global TELEMETRY_IS_TIMESERIES
+    retention = int(TELEMETRY_RETENTION_DAYS * 86400) or None
+    kind = storage.collection_type("telemetry")
+    TELEMETRY_IS_TIMESERIES = kind == "timeseries"
+    if TELEMETRY_TIMESERIES:
+        if kind is None:
+            storage.create_timeseries_collection(
+                "telemetry",
+                time_field="received_at",
+                meta_field="device_id",
+                granularity=TELEMETRY_TS_GRANULARITY,
+                expire_after_seconds=retention,
+            )
+            logging.info("Created time-series telemetry collection (%s)", TELEMETRY_TS_GRANULARITY)
+            TELEMETRY_IS_TIMESERIES = True
+            return
+        if kind != "timeseries":
+            logging.warning(
+                "TELEMETRY_TIMESERIES is set but 'telemetry' is a regular collection; "
+                "run `python -m libs.mongo.migrate_timeseries` to convert it."
+            )
+    if retention:
+        storage.set_retention("telemetry", "received_at", retention)
+
 # --- Logic: Storage & Notifications ---
 
-def get_or_create_device_config(hardware_id: str) -> DeviceConfig:
-    """Loads config from DB or returns default."""
-    if MONGO_STORAGE:
-        data = MONGO_STORAGE.db["devices"].find_one({"hardware_id": hardware_id})
-        if data:
-            data.pop("_id", None)
-            return DeviceConfig(**data)
-            
-    # Default Fallback
+# Version of the unsaved default config: the epoch, so its ETag is W/"0"
+# however often it is rebuilt and devices without a config settle on 304
+DEFAULT_CONFIG_UPDATED_AT = datetime(1970, 1, 1)
+
+def default_device_config(hardware_id: str) -> DeviceConfig:
     return DeviceConfig(
         hardware_id=hardware_id, 
         owner_id="default_user",
-        light_schedule=LightSchedule(start=time(6,0), end=time(18,0))
+        light_schedule=LightSchedule(start=time(6,0), end=time(18,0)),
+        updated_at=DEFAULT_CONFIG_UPDATED_AT,
     )
 
-def save_device_config(config: DeviceConfig):
-    if MONGO_STORAGE:
+async def get_or_create_device_config(hardware_id: str) -> DeviceConfig:
+    """
+    Loads config from cache, then DB, or returns default.
+    The returned model is shared with the cache: use copy_model() before mutating.
+    """
+    cached = DEVICE_CONFIG_CACHE.get(hardware_id)
+    if cached is not None:
+        return cached
+
+    config = None
+    if ASYNC_MONGO_STORAGE:
+        data = await ASYNC_MONGO_STORAGE.find_one("devices", {"hardware_id": hardware_id})
+        if data:
+            data.pop("_id", None)
+            config = DeviceConfig(**data)
+            
+    # Default Fallback
+    if config is None:
+        config = default_device_config(hardware_id)
+    DEVICE_CONFIG_CACHE.put(config)
+    return config
+
+async def load_device_configs(hardware_ids: List[str]) -> Dict[str, DeviceConfig]:
+    """Loads many configs with a single query for cache misses, filling gaps with defaults."""
+    configs: Dict[str, DeviceConfig] = {}
+    missing = []
+    for hardware_id in hardware_ids:
+        cached = DEVICE_CONFIG_CACHE.get(hardware_id)
+        if cached is not None:
+            configs[hardware_id] = cached
+        else:
+            missing.append(hardware_id)
+
+    if ASYNC_MONGO_STORAGE and missing:
+        cursor = ASYNC_MONGO_STORAGE.find("devices", {"hardware_id": {"$in": missing}})
+        async for data in cursor:
+            data.pop("_id", None)
+            configs[data["hardware_id"]] = DeviceConfig(**data)
+    for hardware_id in missing:
+        if hardware_id not in configs:
+            configs[hardware_id] = default_device_config(hardware_id)
+        DEVICE_CONFIG_CACHE.put(configs[hardware_id])
+    return configs
+
+async def save_device_config(config: DeviceConfig):
+    if ASYNC_MONGO_STORAGE:
         data = model_to_dict(config)
-        MONGO_STORAGE.db["devices"].update_one(
+        await ASYNC_MONGO_STORAGE.update_one(
+            "devices",
             {"hardware_id": config.hardware_id},
             {"$set": data},
             upsert=True
         )
+    DEVICE_CONFIG_CACHE.put(config)
+    RESOURCE_VERSIONS.put("config", config.hardware_id, config.updated_at)
 
-def store_telemetry(record: TelemetryRecord):
-    if MONGO_STORAGE:
-        MONGO_STORAGE.insert_one("telemetry", model_to_dict(record))
+def unwritten_docs(docs: List[Dict[str, Any]], exc: Any) -> List[Dict[str, Any]]:
+    """
+    Docs of an unordered insert_many that did not land, given its BulkWriteError.
 
-def check_alerts(telemetry: TelemetryIn, config: DeviceConfig) -> List[str]:
-    alerts = []
-    sensors = telemetry.sensors
-    targets = config.targets
+    insert_many stamps ``_id`` on each doc in place, so a doc retried after an
+    ambiguous failure (e.g. a lost reply) hits a duplicate key: it is already
+    stored and counts as written (time-series collections have no unique
+    ``_id``; write_telemetry_docs skips those retries up front). A write
+    concern error leaves every other doc unconfirmed, so those are retried too.
+    """
+    write_errors = exc.details.get("writeErrors", [])
+    duplicates = {e["index"] for e in write_errors if e.get("code") == DUPLICATE_KEY_ERROR}
+    if exc.details.get("writeConcernErrors"):
+        return [doc for i, doc in enumerate(docs) if i not in duplicates]
+    failed = {e["index"] for e in write_errors} - duplicates
+    return [docs[i] for i in sorted(failed)]
+
+def stored_retries(docs: List[Dict[str, Any]]) -> set:
+    """
+    ``_id``s of retried docs (stamped by an earlier insert_many) that are
+    already stored. Time-series collections do not enforce a unique ``_id``,
+    so a retry after an ambiguous failure would store a reading twice
+    instead of failing with a duplicate key. The lookup is bounded by
+    device_id and received_at so it goes through the telemetry index.
+    """
+    retried = [doc for doc in docs if "_id" in doc]
+    if not retried:
+        return set()
+    query = {
+        "device_id": {"$in": list({doc["device_id"] for doc in retried})},
+        "received_at": {
+            "$gte": min(doc["received_at"] for doc in retried),
+            "$lte": max(doc["received_at"] for doc in retried),
+        },
+        "_id": {"$in": [doc["_id"] for doc in retried]},
+    }
+    return {doc["_id"] for doc in MONGO_STORAGE.find("telemetry", query, {"_id": 1})}
 
-    # Example Check: Air Temp
-    if "air_temp" in targets:
-       t = targets["air_temp"]
-       if sensors.air_temp_c < t.min or sensors.air_temp_c > t.max:
-           alerts.append(f"Temp {sensors.air_temp_c}°C out of range ({t.min}-{t.max})")
+def write_telemetry_docs(docs: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """
+    Writes raw telemetry documents straight to Mongo, then folds the written
+    ones into the rollups. Returns the docs that must be retried.
 
+    On a time-series collection, retried docs already stored are skipped
+    (see stored_retries) but still rolled up: the attempt that stored them
+    did not report them as written.
+    """
+    failed: List[Dict[str, Any]] = []
+    pending = docs
+    if TELEMETRY_IS_TIMESERIES:
+        stored = stored_retries(docs)
+        pending = [doc for doc in docs if doc.get("_id") not in stored] if stored else docs
+    try:
+        if pending:
+            MONGO_STORAGE.insert_many("telemetry", pending)
+    except BulkWriteError as exc:
+        failed = unwritten_docs(pending, exc)
+        if failed:
+            logging.warning("Telemetry insert of %d/%d docs failed: %s", len(failed), len(pending), exc)
+    if TELEMETRY_ROLLUPS:
+        failed_ids = {id(doc) for doc in failed}
+        written = [doc for doc in docs if id(doc) not in failed_ids]
+        # The raw insert already succeeded; a rollup failure must not trigger a retry of it
+        try:
+            write_rollups(written)
+        except Exception as exc:
+            logging.warning("Rollup update for %d docs failed: %s", len(written), exc)
+    return failed
 
-    # Example Check: Water Level
-    if "water_level" in targets:
-       w = targets["water_level"]
-       if sensors.water_level_pct < w.min: 
-            alerts.append(f"Water level low: {sensors.water_level_pct}%")
+async def write_telemetry_docs_async(docs: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """
+    Request-path variant of write_telemetry_docs on the async client.
+    Returns the docs that were not stored; the client retries those.
+    """
+    failed: List[Dict[str, Any]] = []
+    try:
+        await ASYNC_MONGO_STORAGE.insert_many("telemetry", docs)
+    except BulkWriteError as exc:
+        failed = unwritten_docs(docs, exc)
+        if failed:
+            logging.warning("Telemetry insert of %d/%d docs failed: %s", len(failed), len(docs), exc)
+    if TELEMETRY_ROLLUPS:
+        failed_ids = {id(doc) for doc in failed}
+        written = [doc for doc in docs if id(doc) not in failed_ids]
+        try:
+            await write_rollups_async(written)
+        except Exception as exc:
+            logging.warning("Rollup update for %d docs failed: %s", len(written), exc)
+    return failed
 
-    return alerts
+# --- Logic: Telemetry Rollups ---
+
+def rollup_collection(resolution: str) -> str:
+    return f"telemetry_rollup_{resolution}"
+
+def bucket_start(moment: datetime, seconds: int) -> datetime:
+    epoch = datetime(1970, 1, 1)
+    offset = int((moment - epoch).total_seconds()) // seconds * seconds
+    return epoch + timedelta(seconds=offset)
+
+def rollup_updates(docs: Iterable[Dict[str, Any]], seconds: int) -> List[Any]:
+    """
+    Pre-aggregates raw docs per (device, bucket) and returns one upsert per
+    bucket that merges min/max and adds sum/count into the stored rollup.
+    """
+    buckets: Dict[Tuple[str, datetime], Dict[str, Any]] = {}
+    for doc in docs:
+        key = (doc["device_id"], bucket_start(doc["received_at"], seconds))
+        bucket = buckets.setdefault(key, {"count": 0, "sensors": {}})
+        bucket["count"] += 1
+        for name, value in (doc.get("sensors") or {}).items():
+            if not isinstance(value, (int, float)) or isinstance(value, bool):
+                continue
+            if name in NO_READING_BELOW_ZERO and value < 0:
+                continue  # negative means "no reading"
+            stats = bucket["sensors"].get(name)
+            if stats is None:
+                bucket["sensors"][name] = {"min": value, "max": value, "sum": value, "count": 1}
+            else:
+                stats["min"] = min(stats["min"], value)
+                stats["max"] = max(stats["max"], value)
+                stats["sum"] += value
+                stats["count"] += 1
+
+    updates = []
+    for (device_id, start), bucket in buckets.items():
+        mins = {f"sensors.{name}.min": stats["min"] for name, stats in bucket["sensors"].items()}
+        maxs = {f"sensors.{name}.max": stats["max"] for name, stats in bucket["sensors"].items()}
+        incs = {"count": bucket["count"]}
+        for name, stats in bucket["sensors"].items():
+            incs[f"sensors.{name}.sum"] = stats["sum"]
+            incs[f"sensors.{name}.count"] = stats["count"]
+        update: Dict[str, Any] = {"$inc": incs}
+        if mins:
+            update["$min"] = mins
+            update["$max"] = maxs
+        updates.append(UpdateOne({"device_id": device_id, "bucket": start}, update, upsert=True))
+    return updates
+
+def write_rollups(docs: List[Dict[str, Any]]):
+    for resolution, seconds in ROLLUP_RESOLUTIONS.items():
+        MONGO_STORAGE.bulk_write(rollup_collection(resolution), rollup_updates(docs, seconds))
+
+async def write_rollups_async(docs: List[Dict[str, Any]]):
+    """
+    Updates every resolution concurrently, so the request waits one round
+    trip, not three. All writes finish before the first error is raised.
+    """
+    results = await asyncio.gather(
+        *(
+            ASYNC_MONGO_STORAGE.bulk_write(rollup_collection(resolution), rollup_updates(docs, seconds))
+            for resolution, seconds in ROLLUP_RESOLUTIONS.items()
+        ),
+        return_exceptions=True,
+    )
+    for result in results:
+        if isinstance(result, BaseException):
+            raise result
+
+def rollup_to_model(doc: Dict[str, Any], resolution: str) -> TelemetryRollup:
+    sensors = {}
+    for name, stats in (doc.get("sensors") or {}).items():
+        count = stats.get("count", 0)
+        if count:
+            sensors[name] = SensorStats(
+                min=stats["min"], max=stats["max"], avg=stats["sum"] / count, count=count
+            )
+    return TelemetryRollup(
+        device_id=doc["device_id"],
+        resolution=resolution,
+        bucket=doc["bucket"],
+        count=doc.get("count", 0),
+        sensors=sensors,
+    )
+
+async def store_telemetry(record: TelemetryRecord):
+    if await store_telemetry_many([record]):
+        raise HTTPException(
+            status_code=503,
+            detail="Telemetry could not be stored, retry shortly.",
+            headers={"Retry-After": "1"},
+        )
+
+async def store_telemetry_many(records: List[TelemetryRecord]) -> List[int]:
+    """Stores records through the write-behind buffer or directly. Returns
+    the indexes of records the store rejected (always none when buffered)."""
+    if not ASYNC_MONGO_STORAGE or not records:
+        return []
+    docs = [model_to_dict(r) for r in records]
+    if TELEMETRY_WRITER:
+        try:
+            # Only block (off the event loop) when the buffer is full
+            if not TELEMETRY_WRITER.try_put(docs):
+                await run_in_threadpool(TELEMETRY_WRITER.put, docs)
+        except TelemetryBufferFull:
+            raise HTTPException(
+                status_code=503,
+                detail="Telemetry buffer is full, retry shortly.",
+                headers={"Retry-After": str(max(1, round(TELEMETRY_FLUSH_INTERVAL_S)))},
+            )
+        return []
+    failed_ids = {id(doc) for doc in await write_telemetry_docs_async(docs)}
+    return [index for index, doc in enumerate(docs) if id(doc) in failed_ids]
+
+def mark_devices_seen(hardware_ids: List[str], seen_at: datetime):
+    """Records heartbeats in memory; they reach Mongo on the next presence flush."""
+    for hardware_id in hardware_ids:
+        PRESENCE.beat(hardware_id, seen_at)
+
+def write_heartbeats(heartbeats: Dict[str, datetime]):
+    """Writes coalesced "last seen" values for many devices in one round trip."""
+    if MONGO_STORAGE and heartbeats:
+        MONGO_STORAGE.bulk_write(
+            "devices",
+            [
+                UpdateOne(
+                    {"hardware_id": hardware_id},
+                    {"$max": {"last_seen": seen_at}, "$set": {"is_online": True}},
+                )
+                for hardware_id, seen_at in heartbeats.items()
+            ],
+        )
+
+async def load_online_devices() -> Dict[str, datetime]:
+    """Devices stored as online with their last_seen, to seed the presence set."""
+    if not ASYNC_MONGO_STORAGE:
+        return {}
+    docs = await ASYNC_MONGO_STORAGE.find(
+        "devices", {"is_online": True}, {"_id": 0, "hardware_id": 1, "last_seen": 1}
+    ).to_list()
+    return {doc["hardware_id"]: doc["last_seen"] for doc in docs if doc.get("last_seen")}
+
+async def expire_stale_devices(cutoff: datetime) -> List[str]:
+    """
+    Flips devices still stored as online but last seen before cutoff to
+    offline with one update_many, found through the (is_online, last_seen)
+    index. Devices with a newer heartbeat not yet flushed are left alone.
+    """
+    if not ASYNC_MONGO_STORAGE:
+        return []
+    query = {"is_online": True, "last_seen": {"$lt": cutoff}}
+    docs = await ASYNC_MONGO_STORAGE.find("devices", query, {"_id": 0, "hardware_id": 1}).to_list()
+    stale = []
+    for doc in docs:
+        seen_at = PRESENCE.last_seen(doc["hardware_id"])
+        if seen_at is None or seen_at < cutoff:
+            stale.append(doc["hardware_id"])
+    if stale:
+        await ASYNC_MONGO_STORAGE.update_many(
+            "devices", {**query, "hardware_id": {"$in": stale}}, {"$set": {"is_online": False}}
+        )
+    return stale
+
+async def notify_presence_transitions(came_online: List[str], went_offline: List[str]):
+    """Creates one notification per device that changed online state."""
+    silent_for = int(ONLINE_WINDOW.total_seconds() // 60)
+    for hardware_id in went_offline:
+        await queue_notification("warning", f"Device went offline (no heartbeat for {silent_for} min)", hardware_id)
+    for hardware_id in came_online:
+        await queue_notification("info", "Device is online", hardware_id)
+
+def device_last_seen(config: DeviceConfig) -> datetime:
+    """Newest known heartbeat, preferring the in-memory value over the stored one."""
+    seen_at = PRESENCE.last_seen(config.hardware_id)
+    if seen_at is None or seen_at < config.last_seen:
+        return config.last_seen
+    return seen_at
+
+def build_telemetry_record(telemetry: TelemetryIn, received_at: datetime) -> TelemetryRecord:
+    return TelemetryRecord(
+        **model_to_dict(telemetry),
+        received_at=received_at,
+        metadata={"processed_by": "plantbox-v2"}
+    )
+
+class AlertCheck(NamedTuple):
+    metric: str
+    value: float
+    message: Optional[str]  # set when the reading violates the target
+    low: bool  # True when the violated bound is the min
+    clears_low: bool  # value >= min + band: clears an alert that fired low
+    clears_high: bool  # value <= max - band: clears an alert that fired high
 
-def queue_notification(level: str, message: str, device_id: str):
+def hysteresis_band(target: TargetRange) -> float:
+    if target.hysteresis is not None:
+        return target.hysteresis
+    return (target.max - target.min) * ALERT_HYSTERESIS_PCT / 100
+
+def sensor_matrix(sensor_rows: List[Dict[str, Any]]) -> np.ndarray:
+    """
+    Packs sensor dicts into an (n_readings, n_sensors) float array in
+    SENSOR_COLUMNS order. Missing values and "no reading" sentinels become NaN,
+    so they never violate or clear a rule.
+    """
+    values = np.array(
+        [[row.get(column, np.nan) for column in SENSOR_COLUMNS] for row in sensor_rows],
+        dtype=float,
+    ).reshape(len(sensor_rows), len(SENSOR_COLUMNS))
+    for name in NO_READING_BELOW_ZERO:
+        column = values[:, SENSOR_COLUMNS.index(name)]
+        column[column < 0] = np.nan
+    return values
+
+class RuleSet(NamedTuple):
+    metrics: List[str]
+    columns: np.ndarray  # index into SENSOR_COLUMNS per rule
+    mins: np.ndarray
+    maxs: np.ndarray
+    bands: np.ndarray
+
+class RuleEngine:
+    """
+    Compiles each device's ``targets`` into arrays of (sensor column, min, max)
+    rules and evaluates them against whole batches of readings at once.
+
+    Compiled rules are memoized per config object; since configs are shared
+    through DEVICE_CONFIG_CACHE, a cached config is only compiled once.
+    """
+
+    def __init__(self, max_size: int) -> None:
+        self.max_size = max(1, max_size)
+        self._compiled: "OrderedDict[str, Tuple[DeviceConfig, RuleSet]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def compile(self, config: DeviceConfig) -> RuleSet:
+        with self._lock:
+            entry = self._compiled.get(config.hardware_id)
+            if entry is not None and entry[0] is config:
+                self._compiled.move_to_end(config.hardware_id)
+                return entry[1]
+
+        metrics, columns, mins, maxs, bands = [], [], [], [], []
+        for metric, target in config.targets.items():
+            column = TARGET_SENSOR_FIELDS.get(metric, metric)
+            if column not in SENSOR_COLUMNS:
+                continue
+            metrics.append(metric)
+            columns.append(SENSOR_COLUMNS.index(column))
+            mins.append(target.min)
+            maxs.append(target.max)
+            bands.append(hysteresis_band(target))
+        rules = RuleSet(
+            metrics,
+            np.array(columns, dtype=int),
+            np.array(mins, dtype=float),
+            np.array(maxs, dtype=float),
+            np.array(bands, dtype=float),
+        )
+
+        with self._lock:
+            self._compiled[config.hardware_id] = (config, rules)
+            self._compiled.move_to_end(config.hardware_id)
+            while len(self._compiled) > self.max_size:
+                self._compiled.popitem(last=False)
+        return rules
+
+    @staticmethod
+    def evaluate(values: np.ndarray, rules: RuleSet) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+        """
+        Evaluates rules against an (n_readings, n_sensors) matrix.
+        Returns the selected values and the low/high/clears_low/clears_high
+        masks, each shaped (n_readings, n_rules). The band only applies on
+        the side that fired, so a refill to 100% clears a low water alert.
+        """
+        selected = values[:, rules.columns]
+        low = selected < rules.mins
+        high = selected > rules.maxs
+        clears_low = selected >= rules.mins + rules.bands
+        clears_high = selected <= rules.maxs - rules.bands
+        return selected, low, high, clears_low, clears_high
+
+    def evaluate_batch(self, readings: List[TelemetryIn], configs: Dict[str, DeviceConfig]) -> List[List[AlertCheck]]:
+        """Returns the alert checks for each reading, in input order."""
+        results: List[List[AlertCheck]] = [[] for _ in readings]
+        if not readings:
+            return results
+        values = sensor_matrix([model_to_dict(t.sensors) for t in readings])
+
+        rows_by_device: Dict[str, List[int]] = {}
+        for index, telemetry in enumerate(readings):
+            rows_by_device.setdefault(telemetry.device_id, []).append(index)
+
+        for device_id, rows in rows_by_device.items():
+            rules = self.compile(configs[device_id])
+            if not rules.metrics:
+                continue
+            row_index = np.array(rows, dtype=int)
+            selected, low, high, clears_low, clears_high = self.evaluate(values[row_index], rules)
+            # Only (reading, rule) pairs that violate or clear matter to the alert engine
+            for i, j in zip(*np.nonzero(low | high | clears_low | clears_high)):
+                value = float(selected[i, j])
+                results[rows[i]].append(AlertCheck(
+                    rules.metrics[j],
+                    value,
+                    rule_message(rules, j, value, bool(low[i, j]), bool(high[i, j])),
+                    bool(low[i, j]),
+                    bool(clears_low[i, j]),
+                    bool(clears_high[i, j]),
+                ))
+        return results
+
+def rule_message(rules: RuleSet, index: int, value: float, low: bool, high: bool) -> Optional[str]:
+    if not low and not high:
+        return None
+    label, unit = SENSOR_LABELS[SENSOR_COLUMNS[rules.columns[index]]]
+    if low:
+        return f"{label} low: {value:g}{unit} (min {rules.mins[index]:g})"
+    return f"{label} high: {value:g}{unit} (max {rules.maxs[index]:g})"
+
+def evaluate_targets(telemetry: TelemetryIn, config: DeviceConfig) -> List[AlertCheck]:
+    return RULE_ENGINE.evaluate_batch([telemetry], {telemetry.device_id: config})[0]
+
+async def notify_alert_transitions(device_id: str, transitions: List[Tuple[str, str]]):
+    """Creates one notification per level for a device's alert transitions."""
+    firing = [message for state, message in transitions if state == AlertEngine.FIRING]
+    resolved = [message for state, message in transitions if state == AlertEngine.RESOLVED]
+    if firing:
+        await queue_notification("warning", "; ".join(firing), device_id)
+    if resolved:
+        await queue_notification("info", "; ".join(resolved), device_id)
+
+async def queue_notification(level: str, message: str, device_id: str):
     note = Notification(
         id=str(uuid4()),
         level=level,
@@ -222,50 +1081,1260 @@ def queue_notification(level: str, message: str, device_id: str):
     )
     notifications.append(note)
     # Persist notification
-    if MONGO_STORAGE:
-        MONGO_STORAGE.insert_one("notifications", model_to_dict(note))
+    if ASYNC_MONGO_STORAGE:
+        await ASYNC_MONGO_STORAGE.insert_one("notifications", model_to_dict(note))
 
-    if EMAIL_SETTINGS:
+    if EMAIL_DISPATCHER and EMAIL_SETTINGS["to"]:
         try:
-            EMAIL_SETTINGS["client"].send_email(
+            EMAIL_DISPATCHER.enqueue(
                 subject=f"Plantbox Alert: {level.upper()}",
                 body=f"Device: {device_id}\n\n{message}",
-                from_email=EMAIL_SETTINGS["from_email"],
                 to_emails=EMAIL_SETTINGS["to"],
+                device_id=device_id,
             )
+        except queue.Full:
+            logging.warning("Email queue full, dropping alert for %s", device_id)
+
+def write_email_dead_letter(job: EmailJob, body: str):
+    if MONGO_STORAGE:
+        MONGO_STORAGE.insert_one(
+            "email_dead_letters",
+            {**model_to_dict(job), "body": body, "failed_at": datetime.utcnow()},
+        )
+
+def record_status_email_sent(hardware_id: str, sent_at: datetime):
+    if MONGO_STORAGE:
+        MONGO_STORAGE.update_one(
+            "demo_control",
+            {"hardware_id": hardware_id},
+            {
+                "$set": {"last_email_sent": sent_at, "updated_at": sent_at},
+                "$unset": {"status_email_pending": ""},
+            },
+            upsert=True,
+        )
+    RESOURCE_VERSIONS.put("demo_control", hardware_id, sent_at)
+    DEMO_CONTROL_CHANGES.notify(hardware_id)
+
+async def reserve_status_email(hardware_id: str, now: datetime) -> bool:
+    """
+    Claims the device's status-email slot by setting a pending marker on its
+    demo_control doc, only if no email was sent within the cooldown and no
+    other one is pending. The unique hardware_id index keeps one document per
+    device, and the conditional update makes concurrent requests race on it,
+    so at most one of them wins.
+    """
+    try:
+        await ASYNC_MONGO_STORAGE.update_one(
+            "demo_control",
+            {"hardware_id": hardware_id},
+            {"$setOnInsert": {"hardware_id": hardware_id, "updated_at": now}},
+            upsert=True,
+        )
+    except DuplicateKeyError:
+        pass  # a concurrent request inserted it first
+    claimed = await ASYNC_MONGO_STORAGE.update_one(
+        "demo_control",
+        {"$and": [
+            {"hardware_id": hardware_id},
+            {"$or": [
+                {"last_email_sent": None},
+                {"last_email_sent": {"$lt": now - STATUS_EMAIL_COOLDOWN}},
+            ]},
+            {"$or": [
+                {"status_email_pending": None},
+                {"status_email_pending": {"$lt": now - timedelta(seconds=EMAIL_PENDING_TTL_S)}},
+            ]},
+        ]},
+        {"$set": {"status_email_pending": now}},
+    )
+    return claimed == 1
+
+def release_status_email(hardware_id: str):
+    """Frees the slot of a status email that was never delivered."""
+    if MONGO_STORAGE:
+        MONGO_STORAGE.update_one(
+            "demo_control", {"hardware_id": hardware_id}, {"$unset": {"status_email_pending": ""}}
+        )
+
+# --- Write-Behind Telemetry Buffer ---
+
+class TelemetryBufferFull(Exception):
+    """Raised when the write-behind buffer stays full past the put timeout."""
+
+
+class TelemetryWriter:
+    """
+    Queues telemetry documents in memory and writes them in bulk.
+
+    A background thread flushes the queue once it holds ``flush_size``
+    documents or its oldest document is ``flush_interval_s`` old. The queue
+    is bounded by ``max_pending``; producers block for up to ``put_timeout_s``
+    waiting for room and then get ``TelemetryBufferFull``.
+
+    ``flush_fn`` returns the docs the store rejected; only those are
+    queued again. A batch whose write raised is queued again whole.
+    """
+
+    def __init__(
+        self,
+        flush_fn,
+        flush_size: int,
+        flush_interval_s: float,
+        max_pending: int,
+        put_timeout_s: float,
+    ) -> None:
+        self._flush_fn = flush_fn
+        self.flush_size = max(1, flush_size)
+        self.flush_interval_s = flush_interval_s
+        self.max_pending = max(self.flush_size, max_pending)
+        self.put_timeout_s = put_timeout_s
+
+        self._pending: List[Dict[str, Any]] = []
+        self._oldest: Optional[float] = None
+        self._cond = threading.Condition()
+        self._flush_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+        self._counters = {
+            "enqueued": 0,
+            "written": 0,
+            "rejected": 0,
+            "dropped": 0,
+            "flushes": 0,
+            "failed_flushes": 0,
+        }
+        self._last_flush_ms = 0.0
+        self._max_flush_ms = 0.0
+        self._total_flush_ms = 0.0
+
+    def start(self) -> None:
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="telemetry-writer", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        """Stops the flusher thread and writes whatever is still queued."""
+        self._stop.set()
+        with self._cond:
+            self._cond.notify_all()
+        if self._thread:
+            self._thread.join()
+            self._thread = None
+        self.flush()
+
+    def try_put(self, docs: List[Dict[str, Any]]) -> bool:
+        """Queues docs only if there is room right now; never blocks."""
+        with self._cond:
+            if len(self._pending) + len(docs) > self.max_pending:
+                return False
+            self._enqueue(docs)
+            return True
+
+    def put(self, docs: List[Dict[str, Any]]) -> None:
+        deadline = time_lib.monotonic() + self.put_timeout_s
+        with self._cond:
+            while len(self._pending) + len(docs) > self.max_pending:
+                remaining = deadline - time_lib.monotonic()
+                if remaining <= 0:
+                    self._counters["rejected"] += len(docs)
+                    raise TelemetryBufferFull()
+                self._cond.wait(remaining)
+            self._enqueue(docs)
+
+    def _enqueue(self, docs: List[Dict[str, Any]]) -> None:
+        # Caller holds self._cond
+        self._pending.extend(docs)
+        if self._oldest is None:
+            self._oldest = time_lib.monotonic()
+        self._counters["enqueued"] += len(docs)
+        if len(self._pending) >= self.flush_size:
+            self._cond.notify_all()
+
+    def flush(self) -> int:
+        """Writes out everything queued so far. Returns the number written."""
+        with self._flush_lock:
+            with self._cond:
+                batch, self._pending = self._pending, []
+                self._oldest = None
+                # Wake producers waiting for room
+                self._cond.notify_all()
+            if not batch:
+                return 0
+
+            started = time_lib.perf_counter()
+            try:
+                failed = self._flush_fn(batch) or []
+            except Exception as exc:
+                logging.warning("Telemetry flush of %d docs failed: %s", len(batch), exc)
+                self._counters["failed_flushes"] += 1
+                self._requeue(batch)
+                return 0
+            finally:
+                elapsed_ms = (time_lib.perf_counter() - started) * 1000
+                self._last_flush_ms = elapsed_ms
+                self._max_flush_ms = max(self._max_flush_ms, elapsed_ms)
+                self._total_flush_ms += elapsed_ms
+
+            written = len(batch) - len(failed)
+            if failed:
+                # Only the docs the store rejected go back; the rest are stored
+                self._counters["failed_flushes"] += 1
+                self._requeue(failed)
+            else:
+                self._counters["flushes"] += 1
+            self._counters["written"] += written
+            return written
+
+    def stats(self) -> Dict[str, Any]:
+        with self._cond:
+            depth = len(self._pending)
+            oldest_age = time_lib.monotonic() - self._oldest if self._oldest is not None else 0.0
+        flushes = self._counters["flushes"] + self._counters["failed_flushes"]
+        return {
+            **self._counters,
+            "queue_depth": depth,
+            "queue_capacity": self.max_pending,
+            "oldest_age_s": round(oldest_age, 3),
+            "last_flush_ms": round(self._last_flush_ms, 3),
+            "max_flush_ms": round(self._max_flush_ms, 3),
+            "avg_flush_ms": round(self._total_flush_ms / flushes, 3) if flushes else 0.0,
+        }
+
+    def _requeue(self, batch: List[Dict[str, Any]]) -> None:
+        """Puts a failed batch back at the front, dropping what no longer fits."""
+        with self._cond:
+            room = max(0, self.max_pending - len(self._pending))
+            kept = batch[:room]
+            self._counters["dropped"] += len(batch) - len(kept)
+            self._pending[:0] = kept
+            if kept and self._oldest is None:
+                self._oldest = time_lib.monotonic()
+
+    def _flush_due(self) -> bool:
+        if self._stop.is_set() or len(self._pending) >= self.flush_size:
+            return True
+        return self._oldest is not None and time_lib.monotonic() - self._oldest >= self.flush_interval_s
+
+    def _run(self) -> None:
+        while not self._stop.is_set():
+            with self._cond:
+                due = self._cond.wait_for(self._flush_due, timeout=self.flush_interval_s)
+            if due and not self._stop.is_set():
+                self.flush()
+
+
+def build_telemetry_writer() -> Optional[TelemetryWriter]:
+    if not TELEMETRY_WRITE_BEHIND or not MONGO_STORAGE:
+        return None
+    logging.info(
+        "Telemetry write-behind enabled (flush at %d docs / %.1fs, capacity %d)",
+        TELEMETRY_FLUSH_SIZE, TELEMETRY_FLUSH_INTERVAL_S, TELEMETRY_BUFFER_MAX,
+    )
+    return TelemetryWriter(
+        write_telemetry_docs,
+        flush_size=TELEMETRY_FLUSH_SIZE,
+        flush_interval_s=TELEMETRY_FLUSH_INTERVAL_S,
+        max_pending=TELEMETRY_BUFFER_MAX,
+        put_timeout_s=TELEMETRY_BUFFER_PUT_TIMEOUT_S,
+    )
+
+# --- Alert State Machine ---
+
+class AlertEngine:
+    """
+    Tracks alert state per (device, metric): OK -> FIRING -> RESOLVED.
+
+    Only transitions are reported: a metric fires when a reading violates
+    its target, is re-notified at most every ``renotify_s`` seconds while it
+    keeps firing, and resolves once a reading is back past the hysteresis
+    band on the side that fired (``min + band`` for a low alert, ``max - band``
+    for a high one). Readings between the target edge and the band keep the
+    alert firing so values hovering at a boundary do not flap.
+    """
+
+    OK = "ok"
+    FIRING = "firing"
+    RESOLVED = "resolved"
+
+    def __init__(self, renotify_s: float) -> None:
+        self.renotify_s = renotify_s
+        self._states: Dict[Tuple[str, str], Dict[str, Any]] = {}
+        self._lock = threading.Lock()
+        self._counters = {"fired": 0, "renotified": 0, "resolved": 0, "suppressed": 0}
+
+    def observe(self, device_id: str, checks: List[AlertCheck], now: datetime) -> List[Tuple[str, str]]:
+        """Feeds one reading's checks; returns (state, message) for each transition."""
+        transitions = []
+        with self._lock:
+            for check in checks:
+                key = (device_id, check.metric)
+                entry = self._states.get(key)
+                firing = entry is not None and entry["state"] == self.FIRING
+
+                if check.message:
+                    side = "low" if check.low else "high"
+                    if not firing:
+                        self._states[key] = {"state": self.FIRING, "since": now, "last_notified": now, "side": side}
+                        transitions.append((self.FIRING, check.message))
+                        self._counters["fired"] += 1
+                        continue
+                    entry["side"] = side
+                    if (now - entry["last_notified"]).total_seconds() >= self.renotify_s:
+                        entry["last_notified"] = now
+                        transitions.append((self.FIRING, f"{check.message} (still firing)"))
+                        self._counters["renotified"] += 1
+                    else:
+                        self._counters["suppressed"] += 1
+                elif firing and (check.clears_low if entry["side"] == "low" else check.clears_high):
+                    self._states[key] = {"state": self.RESOLVED, "since": now, "last_notified": now}
+                    transitions.append((self.RESOLVED, f"Resolved: {check.metric} back in range ({check.value})"))
+                    self._counters["resolved"] += 1
+        return transitions
+
+    def state(self, device_id: str) -> Dict[str, Dict[str, Any]]:
+        with self._lock:
+            return {
+                metric: dict(entry)
+                for (entry_device, metric), entry in self._states.items()
+                if entry_device == device_id
+            }
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            firing = sum(1 for entry in self._states.values() if entry["state"] == self.FIRING)
+            return {**self._counters, "firing": firing, "tracked": len(self._states)}
+
+# --- Outbound Email Dispatch ---
+
+class EmailDispatcher:
+    """
+    Sends emails from a bounded queue on a small pool of worker threads.
+
+    Failed sends are retried with exponential backoff. Jobs that still
+    fail after ``max_attempts`` are handed to ``dead_letter_fn``. Recent
+    job states are kept in memory so callers can poll them by id.
+    """
+
+    def __init__(
+        self,
+        client,
+        from_email: str,
+        workers: int,
+        max_queue: int,
+        max_attempts: int,
+        retry_base_s: float,
+        dead_letter_fn,
+        max_tracked_jobs: int = 1000,
+    ) -> None:
+        self._client = client
+        self._from_email = from_email
+        self.workers = max(1, workers)
+        self.max_attempts = max(1, max_attempts)
+        self.retry_base_s = retry_base_s
+        self._dead_letter_fn = dead_letter_fn
+        self._queue: "queue.Queue[tuple]" = queue.Queue(maxsize=max_queue)
+        self._jobs: "OrderedDict[str, EmailJob]" = OrderedDict()
+        self._max_tracked_jobs = max_tracked_jobs
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._threads: List[threading.Thread] = []
+        self._counters = {"enqueued": 0, "sent": 0, "retries": 0, "dead_lettered": 0}
+
+    def start(self) -> None:
+        if self._threads:
+            return
+        self._stop.clear()
+        for index in range(self.workers):
+            thread = threading.Thread(target=self._run, name=f"email-worker-{index}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def stop(self, timeout_s: float = EMAIL_SHUTDOWN_TIMEOUT_S) -> None:
+        """Lets workers drain the queue (skipping backoff waits) for up to ``timeout_s``."""
+        self._stop.set()
+        deadline = time_lib.monotonic() + timeout_s
+        for thread in self._threads:
+            thread.join(max(0.0, deadline - time_lib.monotonic()))
+        if self._queue.qsize():
+            logging.warning("Email dispatcher stopped with %d jobs still queued", self._queue.qsize())
+        self._threads = []
+
+    def enqueue(
+        self,
+        subject: str,
+        body: str,
+        to_emails: List[str],
+        device_id: Optional[str] = None,
+        on_sent=None,
+        on_failed=None,
+    ) -> EmailJob:
+        """Queues a message; raises ``queue.Full`` when the queue is at capacity.
+
+        ``on_sent`` runs after delivery, ``on_failed`` once the job is dead-lettered.
+        """
+        job = EmailJob(id=str(uuid4()), subject=subject, to=list(to_emails), device_id=device_id)
+        self._queue.put_nowait((job, body, on_sent, on_failed))
+        with self._lock:
+            self._jobs[job.id] = job
+            while len(self._jobs) > self._max_tracked_jobs:
+                self._jobs.popitem(last=False)
+            self._counters["enqueued"] += 1
+        return job
+
+    def get_job(self, job_id: str) -> Optional[EmailJob]:
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {**self._counters, "queue_depth": self._queue.qsize(), "workers": len(self._threads)}
+
+    def _set_status(self, job: EmailJob, status: str, error: Optional[str] = None) -> None:
+        with self._lock:
+            job.status = status
+            job.last_error = error
+            job.updated_at = datetime.utcnow()
+
+    def _run(self) -> None:
+        while True:
+            try:
+                job, body, on_sent, on_failed = self._queue.get(timeout=0.5)
+            except queue.Empty:
+                if self._stop.is_set():
+                    return
+                continue
+            try:
+                self._deliver(job, body, on_sent, on_failed)
+            finally:
+                self._queue.task_done()
+
+    def _deliver(self, job: EmailJob, body: str, on_sent, on_failed) -> None:
+        while True:
+            job.attempts += 1
+            self._set_status(job, "sending")
+            try:
+                self._client.send_email(
+                    subject=job.subject,
+                    body=body,
+                    from_email=self._from_email,
+                    to_emails=job.to,
+                )
+            except Exception as exc:
+                if job.attempts >= self.max_attempts:
+                    logging.error("Email %s failed after %d attempts: %s", job.id, job.attempts, exc)
+                    self._set_status(job, "dead_lettered", str(exc))
+                    with self._lock:
+                        self._counters["dead_lettered"] += 1
+                    try:
+                        self._dead_letter_fn(job, body)
+                    except Exception as dl_exc:
+                        logging.error("Could not record dead-lettered email %s: %s", job.id, dl_exc)
+                    if on_failed:
+                        try:
+                            on_failed(job)
+                        except Exception as hook_exc:
+                            logging.warning("Failure hook for email %s failed: %s", job.id, hook_exc)
+                    return
+                delay = min(60.0, self.retry_base_s * 2 ** (job.attempts - 1))
+                logging.warning("Email %s attempt %d failed (%s), retrying in %.1fs", job.id, job.attempts, exc, delay)
+                self._set_status(job, "retrying", str(exc))
+                with self._lock:
+                    self._counters["retries"] += 1
+                # Shutdown cuts the backoff short so the queue can drain
+                self._stop.wait(delay)
+                continue
+
+            self._set_status(job, "sent")
+            with self._lock:
+                self._counters["sent"] += 1
+            if on_sent:
+                try:
+                    on_sent(job)
+                except Exception as exc:
+                    logging.warning("Post-send hook for email %s failed: %s", job.id, exc)
+            return
+
+
+def build_email_dispatcher() -> Optional[EmailDispatcher]:
+    if not EMAIL_SETTINGS:
+        return None
+    return EmailDispatcher(
+        EMAIL_SETTINGS["client"],
+        from_email=EMAIL_SETTINGS["from_email"],
+        workers=EMAIL_WORKERS,
+        max_queue=EMAIL_QUEUE_MAX,
+        max_attempts=EMAIL_MAX_ATTEMPTS,
+        retry_base_s=EMAIL_RETRY_BASE_S,
+        dead_letter_fn=write_email_dead_letter,
+    )
+
+# --- Presence Tracking ---
+
+class PresenceTracker:
+    """
+    Keeps the newest heartbeat per device in memory.
+
+    Heartbeats only mark a device dirty; a background thread writes all
+    dirty devices every ``flush_interval_s`` seconds with one bulk write.
+
+    The set of online devices is kept here too, so transitions are found
+    without reading the database. A heartbeat from a device outside the
+    set is recorded as coming online; ``sweep`` drops silent devices.
+    """
+
+    def __init__(self, flush_fn, flush_interval_s: float) -> None:
+        self._flush_fn = flush_fn
+        self.flush_interval_s = flush_interval_s
+        self._last_seen: Dict[str, datetime] = {}
+        self._dirty: set = set()
+        self._online: set = set()
+        self._came_online: set = set()
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._counters = {"beats": 0, "written": 0, "flushes": 0, "failed_flushes": 0}
+        self._last_flush_ms = 0.0
+
+    def start(self) -> None:
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="presence-flusher", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread:
+            self._thread.join()
+            self._thread = None
+        self.flush()
+
+    def beat(self, hardware_id: str, seen_at: datetime) -> None:
+        with self._lock:
+            current = self._last_seen.get(hardware_id)
+            if current is None or seen_at > current:
+                self._last_seen[hardware_id] = seen_at
+            self._dirty.add(hardware_id)
+            if hardware_id not in self._online:
+                self._online.add(hardware_id)
+                self._came_online.add(hardware_id)
+            self._counters["beats"] += 1
+
+    def last_seen(self, hardware_id: str) -> Optional[datetime]:
+        with self._lock:
+            return self._last_seen.get(hardware_id)
+
+    def seed(self, online: Dict[str, datetime]) -> None:
+        """Marks devices stored as online, without reporting them as transitions."""
+        with self._lock:
+            for hardware_id, seen_at in online.items():
+                current = self._last_seen.get(hardware_id)
+                if current is None or seen_at > current:
+                    self._last_seen[hardware_id] = seen_at
+                self._online.add(hardware_id)
+
+    def sweep(self, cutoff: datetime) -> Tuple[List[str], List[str]]:
+        """Returns devices that came online since the last sweep and those
+        last seen before cutoff, which leave the online set."""
+        with self._lock:
+            came_online, self._came_online = self._came_online, set()
+            went_offline = []
+            for hardware_id in self._online:
+                seen_at = self._last_seen.get(hardware_id)
+                if seen_at is None or seen_at < cutoff:
+                    went_offline.append(hardware_id)
+            self._online.difference_update(went_offline)
+        return sorted(came_online - set(went_offline)), sorted(went_offline)
+
+    def flush(self) -> int:
+        with self._lock:
+            dirty, self._dirty = self._dirty, set()
+            heartbeats = {hardware_id: self._last_seen[hardware_id] for hardware_id in dirty}
+        if not heartbeats:
+            return 0
+
+        started = time_lib.perf_counter()
+        try:
+            self._flush_fn(heartbeats)
         except Exception as exc:
-            logging.warning("Email send failed: %s", exc)
+            logging.warning("Heartbeat flush of %d devices failed: %s", len(heartbeats), exc)
+            with self._lock:
+                self._dirty |= dirty
+                self._counters["failed_flushes"] += 1
+            return 0
+        self._last_flush_ms = (time_lib.perf_counter() - started) * 1000
+        with self._lock:
+            self._counters["flushes"] += 1
+            self._counters["written"] += len(heartbeats)
+        return len(heartbeats)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                **self._counters,
+                "tracked_devices": len(self._last_seen),
+                "online_devices": len(self._online),
+                "dirty_devices": len(self._dirty),
+                "last_flush_ms": round(self._last_flush_ms, 3),
+            }
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.flush_interval_s):
+            self.flush()
+
+class PresenceSweeper:
+    """
+    Asyncio task that turns silent devices offline every ``interval_s``.
+
+    Each sweep takes the tracker's transitions, then expires devices still
+    stored as online in Mongo, which covers devices this process has not
+    heard from since it started. Each transition is notified once.
+
+    Before the first sweep, stale ``is_online`` flags left in Mongo are
+    reconciled without notifying: only transitions this process observes
+    raise a notification, not devices that went silent long ago.
+    """
+
+    def __init__(self, tracker: PresenceTracker, window: timedelta, interval_s: float) -> None:
+        self.tracker = tracker
+        self.window = window
+        self.interval_s = interval_s
+        self._task: Optional[asyncio.Task] = None
+        self._counters = {"sweeps": 0, "went_offline": 0, "came_online": 0, "reconciled": 0, "failed_sweeps": 0}
+        self._last_sweep_ms = 0.0
+        self._reconciled = False
+
+    async def start(self) -> None:
+        if self._task and not self._task.done():
+            return
+        try:
+            await self.reconcile()
+        except Exception as exc:
+            logging.warning("Presence reconcile failed, retrying on the first sweep: %s", exc)
+        self._task = asyncio.create_task(self._run())
+
+    async def reconcile(self) -> int:
+        """Quietly expires stale stored flags, then seeds the tracker with the rest."""
+        stale = await expire_stale_devices(datetime.utcnow() - self.window)
+        self.tracker.seed(await load_online_devices())
+        self._reconciled = True
+        self._counters["reconciled"] += len(stale)
+        if stale:
+            logging.info("Marked %d devices offline that were stored as online", len(stale))
+        return len(stale)
+
+    async def stop(self) -> None:
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def sweep(self) -> Tuple[List[str], List[str]]:
+        started = time_lib.perf_counter()
+        if not self._reconciled:
+            await self.reconcile()
+        cutoff = datetime.utcnow() - self.window
+        came_online, went_offline = self.tracker.sweep(cutoff)
+        stored = await expire_stale_devices(cutoff)
+        went_offline = sorted(set(went_offline) | set(stored))
+        await notify_presence_transitions(came_online, went_offline)
+        self._last_sweep_ms = (time_lib.perf_counter() - started) * 1000
+        self._counters["sweeps"] += 1
+        self._counters["came_online"] += len(came_online)
+        self._counters["went_offline"] += len(went_offline)
+        return came_online, went_offline
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            **self._counters,
+            "interval_s": self.interval_s,
+            "last_sweep_ms": round(self._last_sweep_ms, 3),
+        }
+
+    async def _run(self) -> None:
+        while True:
+            await asyncio.sleep(self.interval_s)
+            try:
+                await self.sweep()
+            except Exception as exc:
+                logging.warning("Presence sweep failed: %s", exc)
+                self._counters["failed_sweeps"] += 1
+
+# --- Device Config Cache ---
+
+class DeviceConfigCache:
+    """
+    LRU cache of parsed ``DeviceConfig`` models keyed by ``hardware_id``.
+
+    Entries expire ``ttl_s`` seconds after they were loaded so that changes
+    made by other server processes are picked up eventually. Writes made by
+    this process go through ``put``/``invalidate`` and are visible at once.
+    """
+
+    def __init__(self, max_size: int, ttl_s: float) -> None:
+        self.max_size = max(1, max_size)
+        self.ttl_s = ttl_s
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._counters = {
+            "hits": 0,
+            "misses": 0,
+            "expired": 0,
+            "evictions": 0,
+            "invalidations": 0,
+        }
+
+    def get(self, hardware_id: str) -> Optional[DeviceConfig]:
+        with self._lock:
+            entry = self._entries.get(hardware_id)
+            if entry is None:
+                self._counters["misses"] += 1
+                return None
+            config, expires_at = entry
+            if time_lib.monotonic() >= expires_at:
+                del self._entries[hardware_id]
+                self._counters["expired"] += 1
+                self._counters["misses"] += 1
+                return None
+            self._entries.move_to_end(hardware_id)
+            self._counters["hits"] += 1
+            return config
+
+    def put(self, config: DeviceConfig) -> None:
+        with self._lock:
+            self._entries[config.hardware_id] = (config, time_lib.monotonic() + self.ttl_s)
+            self._entries.move_to_end(config.hardware_id)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self._counters["evictions"] += 1
+
+    def invalidate(self, hardware_id: str) -> None:
+        with self._lock:
+            if self._entries.pop(hardware_id, None) is not None:
+                self._counters["invalidations"] += 1
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self._counters["hits"] + self._counters["misses"]
+            return {
+                **self._counters,
+                "size": len(self._entries),
+                "max_size": self.max_size,
+                "ttl_s": self.ttl_s,
+                "hit_ratio": round(self._counters["hits"] / lookups, 4) if lookups else 0.0,
+            }
+
+# --- Conditional Polling (ETags) ---
+
+def resource_version(updated_at: Optional[datetime]) -> int:
+    """A document's updated_at in ms (the precision Mongo stores); 0 if never stored."""
+    if updated_at is None:
+        return 0
+    return (updated_at.replace(tzinfo=None) - datetime(1970, 1, 1)) // timedelta(milliseconds=1)
+
+def resource_etag(updated_at: Optional[datetime]) -> str:
+    return f'W/"{resource_version(updated_at):x}"'
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    # Weak comparison: the W/ prefix is ignored on both sides
+    candidates = {tag.strip().replace("W/", "", 1) for tag in if_none_match.split(",")}
+    return etag.replace("W/", "", 1) in candidates
+
+def not_modified_response(etag: str) -> Response:
+    return Response(status_code=304, headers={"ETag": etag, "Cache-Control": "no-cache"})
+
+class ResourceVersions:
+    """
+    Latest ETag per (resource, hardware_id), so a poll carrying a matching
+    If-None-Match is answered with 304 before anything is loaded.
+
+    Writes made by this process call ``put`` with the new ``updated_at`` and
+    are visible at once; entries expire after ``ttl_s`` so writes from other
+    processes are picked up on the next full load.
+    """
+
+    def __init__(self, max_size: int, ttl_s: float) -> None:
+        self.max_size = max(1, max_size)
+        self.ttl_s = ttl_s
+        self._entries: "OrderedDict[Tuple[str, str], tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._counters = {"not_modified": 0, "full": 0}
+
+    def put(self, resource: str, hardware_id: str, updated_at: Optional[datetime]) -> str:
+        """Records a loaded or written version and returns its ETag.
+
+        A load that raced with a newer write never replaces the newer entry;
+        the ETag of what was loaded is still returned, so callers that wait
+        for changes re-check ``match`` before waiting.
+        """
+        version = resource_version(updated_at)
+        etag = resource_etag(updated_at)
+        key = (resource, hardware_id)
+        now = time_lib.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[2] > now and entry[0] > version:
+                return etag
+            self._entries[key] = (version, etag, now + self.ttl_s)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+        return etag
+
+    def match(self, resource: str, hardware_id: str, if_none_match: Optional[str]) -> Optional[str]:
+        """Returns the known ETag if the client already has it, else None."""
+        if not if_none_match:
+            return None
+        key = (resource, hardware_id)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            _, etag, expires_at = entry
+            if time_lib.monotonic() >= expires_at:
+                del self._entries[key]
+                return None
+        return etag if etag_matches(if_none_match, etag) else None
+
+    def record(self, not_modified: bool) -> None:
+        with self._lock:
+            self._counters["not_modified" if not_modified else "full"] += 1
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {**self._counters, "size": len(self._entries), "ttl_s": self.ttl_s}
+
+class ChangeNotifier:
+    """
+    Wakes requests waiting on a key (a hardware_id) when it changes.
+
+    Waiters are futures on the server's event loop. ``notify`` may be called
+    from the loop or from a background thread.
+    """
+
+    def __init__(self) -> None:
+        self._waiters: Dict[str, set] = {}
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._counters = {"waits": 0, "wakeups": 0, "timeouts": 0}
+
+    async def wait(self, key: str, timeout: float) -> bool:
+        """Returns True if the key changed within timeout, False otherwise."""
+        self._loop = asyncio.get_running_loop()
+        future = self._loop.create_future()
+        self._waiters.setdefault(key, set()).add(future)
+        self._counters["waits"] += 1
+        try:
+            await asyncio.wait_for(future, timeout)
+            return True
+        except asyncio.TimeoutError:
+            self._counters["timeouts"] += 1
+            return False
+        finally:
+            waiters = self._waiters.get(key)
+            if waiters is not None:
+                waiters.discard(future)
+                if not waiters:
+                    del self._waiters[key]
+
+    def notify(self, key: str) -> None:
+        loop = self._loop
+        if loop is None or loop.is_closed():
+            return  # nobody has waited yet
+        try:
+            on_loop = asyncio.get_running_loop() is loop
+        except RuntimeError:
+            on_loop = False
+        if on_loop:
+            self._wake(key)
+        else:
+            loop.call_soon_threadsafe(self._wake, key)
+
+    def _wake(self, key: str) -> None:
+        for future in self._waiters.pop(key, ()):
+            if not future.done():
+                future.set_result(None)
+                self._counters["wakeups"] += 1
+
+    def stats(self) -> Dict[str, Any]:
+        return {**self._counters, "waiting": sum(len(w) for w in self._waiters.values())}
+
+# --- Hot Telemetry Cache ---
+
+class TelemetryHotCache:
+    """
+    Recent telemetry kept in a bounded ring buffer per device.
+
+    Lookups of the latest or last-k readings for a device touch only that
+    device's buffer. The total number of records is capped by
+    ``max_records``; when exceeded, whole buffers of the devices that
+    reported least recently are evicted.
+    """
+
+    def __init__(self, per_device: int, max_records: int) -> None:
+        self.per_device = max(1, per_device)
+        self.max_records = max(self.per_device, max_records)
+        self._buffers: "OrderedDict[str, Deque[TelemetryRecord]]" = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+        self._evicted_devices = 0
+
+    def append(self, record: TelemetryRecord) -> None:
+        self.extend([record])
+
+    def extend(self, records: List[TelemetryRecord]) -> None:
+        with self._lock:
+            for record in records:
+                buffer = self._buffers.get(record.device_id)
+                if buffer is None:
+                    buffer = self._buffers[record.device_id] = deque(maxlen=self.per_device)
+                else:
+                    self._buffers.move_to_end(record.device_id)
+                if len(buffer) < self.per_device:
+                    self._size += 1
+                buffer.append(record)
+            self._evict()
+
+    def latest(self, device_id: str) -> Optional[TelemetryRecord]:
+        with self._lock:
+            buffer = self._buffers.get(device_id)
+            return buffer[-1] if buffer else None
+
+    def last(self, device_id: str, k: Optional[int] = None) -> List[TelemetryRecord]:
+        """Up to ``k`` most recent records for a device, oldest first."""
+        with self._lock:
+            buffer = self._buffers.get(device_id)
+            if not buffer:
+                return []
+            if k is None or k >= len(buffer):
+                return list(buffer)
+            # Walk from the newest end so the cost is O(k), not O(buffer)
+            newest = []
+            for record in reversed(buffer):
+                newest.append(record)
+                if len(newest) == k:
+                    break
+            newest.reverse()
+            return newest
+
+    def devices(self) -> List[str]:
+        with self._lock:
+            return list(self._buffers)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "devices": len(self._buffers),
+                "records": self._size,
+                "max_records": self.max_records,
+                "per_device": self.per_device,
+                "evicted_devices": self._evicted_devices,
+            }
+
+    def _evict(self) -> None:
+        # Never evict the most recently written device
+        while self._size > self.max_records and len(self._buffers) > 1:
+            _, buffer = self._buffers.popitem(last=False)
+            self._size -= len(buffer)
+            self._evicted_devices += 1
+
+# --- Fleet Summary Cache ---
+
+class FleetCache:
+    """
+    Short-lived cache of fleet summary pages keyed by query parameters.
+
+    Operations views refresh the same few pages from many browsers; within
+    ``ttl_s`` they share one aggregation instead of running one each.
+    """
+
+    def __init__(self, max_size: int, ttl_s: float) -> None:
+        self.max_size = max(1, max_size)
+        self.ttl_s = ttl_s
+        self._entries: "OrderedDict[tuple, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._counters = {"hits": 0, "misses": 0}
+
+    def get(self, key: tuple) -> Optional[Tuple[List[Dict[str, Any]], Optional[str]]]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or time_lib.monotonic() >= entry[1]:
+                self._entries.pop(key, None)
+                self._counters["misses"] += 1
+                return None
+            self._counters["hits"] += 1
+            return entry[0]
+
+    def put(self, key: tuple, page: Tuple[List[Dict[str, Any]], Optional[str]]) -> None:
+        if self.ttl_s <= 0:
+            return
+        with self._lock:
+            self._entries[key] = (page, time_lib.monotonic() + self.ttl_s)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {**self._counters, "size": len(self._entries), "ttl_s": self.ttl_s}
 
 # --- Global State (Memory Cache) ---
-telemetry_log: Deque[TelemetryRecord] = deque(maxlen=500)
+TELEMETRY_CACHE = TelemetryHotCache(TELEMETRY_CACHE_PER_DEVICE, TELEMETRY_CACHE_MAX_RECORDS)
 notifications: Deque[Notification] = deque(maxlen=200)
 EMAIL_SETTINGS = load_email_settings()
 MONGO_STORAGE = build_mongo_storage()
+ASYNC_MONGO_STORAGE: Optional[AsyncMongoStorage] = None  # opened in lifespan
+TELEMETRY_WRITER = build_telemetry_writer()
+DEVICE_CONFIG_CACHE = DeviceConfigCache(DEVICE_CONFIG_CACHE_SIZE, DEVICE_CONFIG_CACHE_TTL_S)
+RESOURCE_VERSIONS = ResourceVersions(DEVICE_CONFIG_CACHE_SIZE * 2, ETAG_TTL_S)
+DEMO_CONTROL_CHANGES = ChangeNotifier()
+PRESENCE = PresenceTracker(write_heartbeats, PRESENCE_FLUSH_INTERVAL_S)
+PRESENCE_SWEEPER = PresenceSweeper(PRESENCE, ONLINE_WINDOW, PRESENCE_SWEEP_INTERVAL_S)
+EMAIL_DISPATCHER = build_email_dispatcher()
+ALERT_ENGINE = AlertEngine(ALERT_RENOTIFY_S)
+RULE_ENGINE = RuleEngine(DEVICE_CONFIG_CACHE_SIZE)
+FLEET_CACHE = FleetCache(FLEET_CACHE_SIZE, FLEET_CACHE_TTL_S)
 
 # --- API Endpoints ---
 
 @app.get("/health")
-def health() -> Dict[str, Any]:
+async def health() -> Dict[str, Any]:
     return {"status": "running"}
 
+@app.get("/stats")
+async def stats() -> Dict[str, Any]:
+    """Internal counters for the in-process pipelines."""
+    return {
+        "telemetry_writer": TELEMETRY_WRITER.stats() if TELEMETRY_WRITER else None,
+        "device_config_cache": DEVICE_CONFIG_CACHE.stats(),
+        "etags": RESOURCE_VERSIONS.stats(),
+        "demo_control_waiters": DEMO_CONTROL_CHANGES.stats(),
+        "presence": PRESENCE.stats(),
+        "presence_sweeper": PRESENCE_SWEEPER.stats(),
+        "email_dispatcher": EMAIL_DISPATCHER.stats() if EMAIL_DISPATCHER else None,
+        "alerts": ALERT_ENGINE.stats(),
+        "telemetry_cache": TELEMETRY_CACHE.stats(),
+        "fleet_cache": FLEET_CACHE.stats(),
+    }
+
+@app.get("/devices", response_model=List[FleetDevice])
+async def list_devices(
+    online: Optional[bool] = None,
+    plant_type: Optional[str] = None,
+    owner_id: Optional[str] = None,
+    limit: int = 100,
+    cursor: Optional[str] = None,
+):
+    """
+    Fleet summary: config summary, online status and latest reading for
+    every device that has a stored config or has sent telemetry, ordered by
+    hardware_id. Filter by online, plant_type and owner_id.
+
+    Pages are keyset-paginated: when more devices exist, the response
+    carries an ``X-Next-Cursor`` header to pass back as ``cursor``. With
+    the online filter a page may hold fewer than ``limit`` rows while the
+    header is still set; keep following it until it is absent. Pages
+    are cached for FLEET_CACHE_TTL_S seconds.
+    """
+    limit = max(1, min(limit, FLEET_PAGE_MAX))
+    key = (online, plant_type, owner_id, limit, cursor)
+    page = FLEET_CACHE.get(key)
+    if page is None:
+        if ASYNC_MONGO_STORAGE:
+            page = await load_fleet_page(online, plant_type, owner_id, limit, cursor)
+        else:
+            page = await load_fleet_page_from_memory(online, plant_type, owner_id, limit, cursor)
+        FLEET_CACHE.put(key, page)
+
+    rows, next_cursor = page
+    fast = raw_json_response(rows)
+    if next_cursor:
+        fast.headers["X-Next-Cursor"] = next_cursor
+    return fast
+
+def fleet_row(doc: Dict[str, Any], now: datetime) -> Dict[str, Any]:
+    """Completes a fleet row with the freshest heartbeat and the online flag derived from it."""
+    last_seen = doc.get("last_seen")
+    seen_at = PRESENCE.last_seen(doc["hardware_id"])
+    if seen_at is not None and (last_seen is None or seen_at > last_seen):
+        last_seen = seen_at
+    doc["last_seen"] = last_seen
+    doc["is_online"] = last_seen is not None and now - last_seen < ONLINE_WINDOW
+    return doc
+
+async def load_fleet_page(
+    online: Optional[bool],
+    plant_type: Optional[str],
+    owner_id: Optional[str],
+    limit: int,
+    cursor: Optional[str],
+) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+    """
+    One aggregation over telemetry. $sort + $group on the (device_id,
+    received_at) index picks the newest reading per device with one index
+    entry each. $unionWith adds devices that never reported, and $lookup
+    joins each page row to its config.
+
+    Without filters the page is cut right after the $sort, so $lookup only
+    runs for the rows returned. Filters read config fields and need the
+    join first, so they cut after the $match.
+
+    The online filter runs in Mongo on the stored last_seen. Heartbeats
+    not yet flushed by PRESENCE are merged in afterwards, so a row whose
+    status flips at the boundary is dropped rather than shown wrongly.
+    Such a page can come back short (even empty) with a next cursor set;
+    callers keep following the cursor until it is absent.
+    """
+    now = datetime.utcnow()
+    after = [{"$match": {"device_id": {"$gt": cursor}}}] if cursor else []
+    devices_after = [{"$match": {"hardware_id": {"$gt": cursor}}}] if cursor else []
+    filters: Dict[str, Any] = {}
+    if plant_type is not None:
+        filters["plant_type"] = plant_type
+    if owner_id is not None:
+        filters["owner_id"] = owner_id
+    if online is not None:
+        cutoff = now - ONLINE_WINDOW
+        filters["last_seen"] = {"$gte": cutoff} if online else {"$not": {"$gte": cutoff}}
+
+    pipeline = [
+        *after,
+        {"$sort": {"device_id": 1, "received_at": -1}},
+        {"$group": {
+            "_id": "$device_id",
+            "sensors": {"$first": "$sensors"},
+            "captured_at": {"$first": "$captured_at"},
+            "received_at": {"$first": "$received_at"},
+        }},
+        {"$unionWith": {
+            "coll": "devices",
+            "pipeline": [*devices_after, {"$project": {"_id": "$hardware_id"}}],
+        }},
+        # Fold the config-only rows into the telemetry rows of the same device
+        {"$group": {
+            "_id": "$_id",
+            "sensors": {"$max": "$sensors"},
+            "captured_at": {"$max": "$captured_at"},
+            "received_at": {"$max": "$received_at"},
+        }},
+        {"$sort": {"_id": 1}},
+        *([] if filters else [{"$limit": limit + 1}]),
+        {"$lookup": {
+            "from": "devices",
+            "localField": "_id",
+            "foreignField": "hardware_id",
+            "as": "device",
+        }},
+        {"$unwind": {"path": "$device", "preserveNullAndEmptyArrays": True}},
+        {"$project": {
+            "_id": 0,
+            "hardware_id": "$_id",
+            "display_name": "$device.display_name",
+            "owner_id": "$device.owner_id",
+            "plant_type": "$device.plant_type",
+            "last_seen": {"$max": ["$device.last_seen", "$received_at"]},
+            "sensors": 1,
+            "captured_at": 1,
+            "received_at": 1,
+        }},
+        *([{"$match": filters}, {"$limit": limit + 1}] if filters else []),
+    ]
+    docs = await (await ASYNC_MONGO_STORAGE.aggregate("telemetry", pipeline)).to_list()
+    next_cursor = None
+    if len(docs) > limit:
+        docs = docs[:limit]
+        next_cursor = docs[-1]["hardware_id"]
+    rows = [fleet_row(doc, now) for doc in docs]
+    if online is not None:
+        rows = [row for row in rows if row["is_online"] == online]
+    return rows, next_cursor
+
+async def load_fleet_page_from_memory(
+    online: Optional[bool],
+    plant_type: Optional[str],
+    owner_id: Optional[str],
+    limit: int,
+    cursor: Optional[str],
+) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+    """Fleet page built from the hot telemetry cache when Mongo is not configured."""
+    now = datetime.utcnow()
+    hardware_ids = sorted(h for h in TELEMETRY_CACHE.devices() if not cursor or h > cursor)
+    configs = await load_device_configs(hardware_ids)
+    rows: List[Dict[str, Any]] = []
+    next_cursor = None
+    for hardware_id in hardware_ids:
+        config = configs[hardware_id]
+        if plant_type is not None and config.plant_type != plant_type:
+            continue
+        if owner_id is not None and config.owner_id != owner_id:
+            continue
+        latest = TELEMETRY_CACHE.latest(hardware_id)
+        row = fleet_row({
+            "hardware_id": hardware_id,
+            "display_name": config.display_name,
+            "owner_id": config.owner_id,
+            "plant_type": config.plant_type,
+            "last_seen": latest.received_at if latest else None,
+            "sensors": model_to_dict(latest.sensors) if latest else None,
+            "captured_at": latest.captured_at if latest else None,
+            "received_at": latest.received_at if latest else None,
+        }, now)
+        if online is not None and row["is_online"] != online:
+            continue
+        if len(rows) == limit:
+            next_cursor = rows[-1]["hardware_id"]
+            break
+        rows.append(row)
+    return rows, next_cursor
+
 @app.get("/devices/{hardware_id}/exists")
-def device_exists(hardware_id: str) -> Dict[str, Any]:
+async def device_exists(hardware_id: str) -> Dict[str, Any]:
     """Check if a device has been initialized in MongoDB."""
-    if MONGO_STORAGE:
-        data = MONGO_STORAGE.db["devices"].find_one({"hardware_id": hardware_id})
+    if ASYNC_MONGO_STORAGE:
+        data = await ASYNC_MONGO_STORAGE.find_one("devices", {"hardware_id": hardware_id})
         return {"exists": data is not None}
     return {"exists": False}
 
 # Endpoint 1: Fetch Reference Values (Config)
 @app.get("/devices/{hardware_id}/fetchRefVals", response_model=DeviceConfig)
-def fetch_reference_values(hardware_id: str):
-    config = get_or_create_device_config(hardware_id)
-    
-    # Calculate online status dynamically
-    time_diff = datetime.utcnow() - config.last_seen
-    config.is_online = time_diff < timedelta(minutes=2)
+async def fetch_reference_values(
+    hardware_id: str,
+    response: Response,
+    if_none_match: Optional[str] = Header(None),
+):
+    """
+    Device config with a weak ETag derived from its updated_at. A matching
+    If-None-Match gets an empty 304. The ETag tracks the config only, so
+    last_seen/is_online in a cached copy may be stale.
+    """
+    etag = RESOURCE_VERSIONS.match("config", hardware_id, if_none_match)
+    if etag:
+        RESOURCE_VERSIONS.record(not_modified=True)
+        return not_modified_response(etag)
+
+    config = await get_or_create_device_config(hardware_id)
+    etag = RESOURCE_VERSIONS.put("config", hardware_id, config.updated_at)
+    unchanged = etag_matches(if_none_match, etag)
+    RESOURCE_VERSIONS.record(not_modified=unchanged)
+    if unchanged:
+        return not_modified_response(etag)
+    response.headers["ETag"] = etag
+    response.headers["Cache-Control"] = "no-cache"
     
-    return config
+    # Calculate online status dynamically from the freshest heartbeat
+    last_seen = device_last_seen(config)
+    time_diff = datetime.utcnow() - last_seen
+    return copy_model(config, last_seen=last_seen, is_online=time_diff < ONLINE_WINDOW)
 
 # Allow updating config via standard REST path (optional helper)
 # Helper for Recursive Updates
@@ -280,14 +2349,14 @@ def deep_merge(source: Dict[str, Any], destination: Dict[str, Any]) -> Dict[str,
     return destination
 
 @app.post("/devices/{hardware_id}/config", response_model=Dict[str, Any])
-def update_device_config(hardware_id: str, payload: Dict[str, Any]):
+async def update_device_config(hardware_id: str, payload: Dict[str, Any]):
     """
     Accepts a partial or full configuration update.
     Deep-merges the payload into the existing MongoDB document.
     """
     # 1. Fetch existing (or defaults if missing)
     # We use get_or_create_device_config but want it as a dict to merge
-    existing_model = get_or_create_device_config(hardware_id)
+    existing_model = await get_or_create_device_config(hardware_id)
     existing_data = model_to_dict(existing_model)
     
     # 2. Merge changes
@@ -299,130 +2368,620 @@ def update_device_config(hardware_id: str, payload: Dict[str, Any]):
     updated_data["updated_at"] = datetime.utcnow()
     
     # 3. Save to Mongo
-    if MONGO_STORAGE:
-        MONGO_STORAGE.db["devices"].update_one(
+    if ASYNC_MONGO_STORAGE:
+        await ASYNC_MONGO_STORAGE.update_one(
+            "devices",
             {"hardware_id": hardware_id},
             {"$set": updated_data},
             upsert=True
         )
+    DEVICE_CONFIG_CACHE.invalidate(hardware_id)
+    RESOURCE_VERSIONS.put("config", hardware_id, updated_data["updated_at"])
         
     return updated_data
 
 # Endpoint 2: Send Telemetry
 @app.post("/sendTelemetry")
-def send_telemetry(telemetry: TelemetryIn) -> Dict[str, Any]:
+async def send_telemetry(telemetry: TelemetryIn = Depends(telemetry_body)) -> Dict[str, Any]:
+    """Accepts JSON, MessagePack or CBOR (see COMPACT_TELEMETRY_FIELDS for the array form)."""
+    alerts = await ingest_telemetry(telemetry)
+    logging.info(f"Telemetry received for {telemetry.device_id}")
+    return {"status": "ok", "alerts": alerts}
+
+async def ingest_telemetry(telemetry: TelemetryIn, config: Optional[DeviceConfig] = None) -> List[str]:
+    """Stores one reading and checks it against the device config. Returns the alert messages."""
     # 1. Update Device "Last Seen" and Status
-    if MONGO_STORAGE:
-        MONGO_STORAGE.db["devices"].update_one(
-            {"hardware_id": telemetry.device_id},
-            {"$set": {"last_seen": datetime.utcnow(), "is_online": True}}
-        )
+    mark_devices_seen([telemetry.device_id], datetime.utcnow())
 
     # 2. Store Telemetry
-    record = TelemetryRecord(
-        **model_to_dict(telemetry),
-        received_at=datetime.utcnow(),
-        metadata={"processed_by": "plantbox-v2"}
+    record = build_telemetry_record(telemetry, datetime.utcnow())
+    await store_telemetry(record)
+    TELEMETRY_CACHE.append(record)
+
+    # 3. Check Alerts against current config; only state changes notify
+    if config is None:
+        config = await get_or_create_device_config(telemetry.device_id)
+    checks = evaluate_targets(telemetry, config)
+    alerts = [check.message for check in checks if check.message]
+    transitions = ALERT_ENGINE.observe(telemetry.device_id, checks, record.received_at)
+    await notify_alert_transitions(telemetry.device_id, transitions)
+    return alerts
+
+@app.post("/devices/{hardware_id}/sync", response_model=DeviceSyncOut)
+async def sync_device(hardware_id: str, payload: Optional[DeviceSyncIn] = None):
+    """
+    One round trip per device cycle: stores the optional reading (same
+    handling as /sendTelemetry) and returns targets, light schedule and
+    demo-control state. Config and demo_control are read together in at
+    most one Mongo query.
+    """
+    config, control = await load_device_state(hardware_id)
+    alerts: List[str] = []
+    if payload and payload.sensors:
+        telemetry = TelemetryIn(
+            device_id=hardware_id,
+            sensors=payload.sensors,
+            captured_at=payload.captured_at or datetime.utcnow(),
+        )
+        alerts = await ingest_telemetry(telemetry, config)
+    else:
+        mark_devices_seen([hardware_id], datetime.utcnow())
+
+    return DeviceSyncOut(
+        hardware_id=hardware_id,
+        targets=config.targets,
+        light_schedule=config.light_schedule,
+        demo_control=control or DemoControl(hardware_id=hardware_id),
+        alerts=alerts,
     )
-    telemetry_log.append(record)
-    store_telemetry(record)
 
-    # 3. Check Alerts against current config
-    config = get_or_create_device_config(telemetry.device_id)
-    alerts = check_alerts(telemetry, config)
-    
-    if alerts:
-        queue_notification("warning", "; ".join(alerts), telemetry.device_id)
+async def load_device_state(hardware_id: str) -> Tuple[DeviceConfig, Optional[DemoControl]]:
+    """
+    Config (from the cache when possible) and demo_control for one device.
+    On a config cache miss both are fetched by a single aggregation that
+    appends the demo_control match to the devices match with $unionWith.
+    """
+    config = DEVICE_CONFIG_CACHE.get(hardware_id)
+    if config is not None or not ASYNC_MONGO_STORAGE:
+        control = await load_demo_control(hardware_id)
+        return config or await get_or_create_device_config(hardware_id), control
+
+    pipeline = [
+        {"$match": {"hardware_id": hardware_id}},
+        {"$limit": 1},
+        {"$set": {"_source": "devices"}},
+        {"$unionWith": {
+            "coll": "demo_control",
+            "pipeline": [
+                {"$match": {"hardware_id": hardware_id}},
+                {"$limit": 1},
+                {"$set": {"_source": "demo_control"}},
+            ],
+        }},
+        {"$unset": "_id"},
+    ]
+    config, control = None, None
+    async for doc in await ASYNC_MONGO_STORAGE.aggregate("devices", pipeline):
+        if doc.pop("_source") == "devices":
+            config = DeviceConfig(**doc)
+        else:
+            control = DemoControl(**doc)
 
-    logging.info(f"Telemetry received for {telemetry.device_id}")
-    return {"status": "ok", "alerts": alerts}
+    if config is None:
+        config = default_device_config(hardware_id)
+    DEVICE_CONFIG_CACHE.put(config)
+    RESOURCE_VERSIONS.put("config", hardware_id, config.updated_at)
+    RESOURCE_VERSIONS.put("demo_control", hardware_id, control.updated_at if control else None)
+    return config, control
+
+@app.post("/sendTelemetryBatch")
+async def send_telemetry_batch(batch: TelemetryBatchIn = Depends(telemetry_batch_body)) -> Dict[str, Any]:
+    """
+    Ingests many readings (from one or many devices) in a single request.
+    Readings are validated together, written with one insert_many and
+    checked against each device's config loaded in one query.
+    Accepts the same encodings as /sendTelemetry.
+
+    Readings the store rejects are listed by index in ``rejected`` (and
+    ``stored: false`` in their result); resend only those.
+    """
+    if not batch.readings:
+        raise HTTPException(status_code=400, detail="Batch contains no readings")
+
+    received_at = datetime.utcnow()
+    device_ids = sorted({t.device_id for t in batch.readings})
+
+    # 1. One heartbeat update per device, not per reading
+    mark_devices_seen(device_ids, received_at)
+
+    # 2. Store all readings at once; rejected ones are reported per index
+    #    so the client resends only those
+    records = [build_telemetry_record(t, received_at) for t in batch.readings]
+    rejected = set(await store_telemetry_many(records))
+    TELEMETRY_CACHE.extend([record for index, record in enumerate(records) if index not in rejected])
+
+    # 3. Check alerts for the whole batch at once, feed them to the
+    #    state machine in order and notify once per device
+    configs = await load_device_configs(device_ids)
+    batch_checks = RULE_ENGINE.evaluate_batch(batch.readings, configs)
+    results = []
+    device_transitions: Dict[str, List[Tuple[str, str]]] = {}
+    for index, (telemetry, checks) in enumerate(zip(batch.readings, batch_checks)):
+        alerts = [check.message for check in checks if check.message]
+        results.append({
+            "index": index,
+            "device_id": telemetry.device_id,
+            "stored": index not in rejected,
+            "alerts": alerts,
+        })
+        transitions = ALERT_ENGINE.observe(telemetry.device_id, checks, received_at)
+        device_transitions.setdefault(telemetry.device_id, []).extend(transitions)
+
+    for device_id, transitions in device_transitions.items():
+        await notify_alert_transitions(device_id, transitions)
+
+    logging.info("Telemetry batch of %d readings received for %d devices", len(records), len(device_ids))
+    return {
+        "status": "partial" if rejected else "ok",
+        "accepted": len(records) - len(rejected),
+        "rejected": sorted(rejected),
+        "results": results,
+    }
+
+@app.get(
+    "/devices/{hardware_id}/telemetry",
+    response_model=Union[List[TelemetryRecord], List[TelemetryRollup]],
+)
+async def list_device_telemetry(
+    response: Response,
+    hardware_id: str,
+    limit: int = 50,
+    resolution: str = "raw",
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    cursor: Optional[str] = None,
+    since: Optional[datetime] = None,
+):
+    """
+    Raw readings (newest first) or, for resolution=1m/15m/1h, pre-aggregated
+    min/max/avg buckets (oldest first) between start and end. Without a start,
+    rollups cover the last ``limit`` buckets before end.
+
+    Raw pages are keyset-paginated: when more readings exist, the response
+    carries an ``X-Next-Cursor`` header to pass back as ``cursor``.
+
+    Incremental polling: ``since`` (a received_at already seen) returns only
+    newer readings, oldest first, at most the newest ``limit`` of them. A
+    full page means readings may have been skipped.
+
+    Raw Mongo documents are stored in TelemetryRecord shape, so they are
+    encoded to JSON directly rather than re-validated row by row.
+    """
+    if resolution != "raw":
+        return await list_device_rollups(hardware_id, resolution, limit, start, end)
+
+    if since and cursor:
+        raise HTTPException(status_code=400, detail="Use either since or cursor, not both")
 
-@app.get("/devices/{hardware_id}/telemetry", response_model=List[TelemetryRecord])
-def list_device_telemetry(hardware_id: str, limit: int = 50):
     limit = max(1, min(limit, 500))
+    clauses: List[Dict[str, Any]] = [{"device_id": hardware_id}]
+    if start or end or since:
+        time_range: Dict[str, Any] = {}
+        if start:
+            time_range["$gte"] = start
+        if since:
+            time_range["$gt"] = since
+        if end:
+            time_range["$lt"] = end
+        clauses.append({"received_at": time_range})
     
     # Try Mongo first for historical data
-    if MONGO_STORAGE:
-        cursor = MONGO_STORAGE.db["telemetry"].find(
-            {"device_id": hardware_id}
-        ).sort("received_at", -1).limit(limit)
-        results = list(cursor)
+    if ASYNC_MONGO_STORAGE:
+        if cursor:
+            after_time, after_id = decode_telemetry_cursor(cursor)
+            # Strictly older than the last row of the previous page, ties broken by _id
+            clauses.append({"$or": [
+                {"received_at": {"$lt": after_time}},
+                {"received_at": after_time, "_id": {"$lt": after_id}},
+            ]})
+        query = clauses[0] if len(clauses) == 1 else {"$and": clauses}
+        # _id is only fetched to build the next cursor
+        results = await ASYNC_MONGO_STORAGE.find(
+            "telemetry",
+            query,
+            TELEMETRY_PROJECTION_WITH_ID,
+            sort=[("received_at", -1), ("_id", -1)],
+            limit=limit + 1,
+        ).to_list()
+        next_cursor = None
+        if len(results) > limit:
+            results = results[:limit]
+            if not since:
+                next_cursor = encode_telemetry_cursor(results[-1])
+        if since:
+            results.reverse()
         for r in results:
             r.pop("_id", None)
-        return [TelemetryRecord(**r) for r in results]
+        fast = raw_json_response(results)
+        if next_cursor:
+            fast.headers["X-Next-Cursor"] = next_cursor
+        return fast
     
-    # Fallback to memory cache
-    return [t for t in telemetry_log if t.device_id == hardware_id][-limit:]
+    # Fallback to memory cache (a single page only)
+    if cursor:
+        return []
+    return [
+        t for t in TELEMETRY_CACHE.last(hardware_id)
+        if (not start or t.received_at >= start) and (not end or t.received_at < end)
+        and (not since or t.received_at > since)
+    ][-limit:]
+
+def encode_telemetry_cursor(doc: Dict[str, Any]) -> str:
+    """Opaque page token for the (received_at, _id) position of a document."""
+    position = {"t": doc["received_at"].isoformat(), "id": str(doc["_id"])}
+    return base64.urlsafe_b64encode(json.dumps(position).encode("utf-8")).decode("ascii")
+
+def decode_telemetry_cursor(token: str) -> Tuple[datetime, Any]:
+    try:
+        position = json.loads(base64.urlsafe_b64decode(token.encode("ascii")))
+        return datetime.fromisoformat(position["t"]), ObjectId(position["id"])
+    except Exception:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+async def list_device_rollups(
+    hardware_id: str,
+    resolution: str,
+    limit: int,
+    start: Optional[datetime],
+    end: Optional[datetime],
+) -> List[TelemetryRollup]:
+    if resolution not in ROLLUP_RESOLUTIONS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Unknown resolution '{resolution}'. Use raw or one of {', '.join(ROLLUP_RESOLUTIONS)}.",
+        )
+    if not ASYNC_MONGO_STORAGE or not TELEMETRY_ROLLUPS:
+        raise HTTPException(status_code=503, detail="Telemetry rollups need MongoDB.")
+
+    seconds = ROLLUP_RESOLUTIONS[resolution]
+    limit = max(1, min(limit, ROLLUP_MAX_POINTS))
+    end = end or datetime.utcnow()
+    start = start or end - timedelta(seconds=seconds * limit)
+    cursor = ASYNC_MONGO_STORAGE.find(
+        rollup_collection(resolution),
+        {"device_id": hardware_id, "bucket": {"$gte": bucket_start(start, seconds), "$lt": end}},
+        sort="bucket",
+        limit=limit,
+    )
+    return [rollup_to_model(doc, resolution) async for doc in cursor]
+
+@app.post("/devices/{hardware_id}/telemetry/rollups/rebuild")
+async def rebuild_device_rollups(hardware_id: str, hours: float = 24) -> Dict[str, Any]:
+    """
+    Recomputes rollups from raw telemetry, e.g. after seeding or importing data.
+    The range is widened to whole hours so every rebuilt bucket is complete.
+    Readings ingested while a rebuild runs may be counted twice.
+    """
+    if not ASYNC_MONGO_STORAGE or not TELEMETRY_ROLLUPS:
+        raise HTTPException(status_code=503, detail="Telemetry rollups need MongoDB.")
+
+    hours = max(0.0, min(hours, 24 * 366))
+    since = bucket_start(datetime.utcnow() - timedelta(hours=hours), max(ROLLUP_RESOLUTIONS.values()))
+    for resolution in ROLLUP_RESOLUTIONS:
+        await ASYNC_MONGO_STORAGE.delete_many(
+            rollup_collection(resolution),
+            {"device_id": hardware_id, "bucket": {"$gte": since}}
+        )
+
+    cursor = ASYNC_MONGO_STORAGE.find(
+        "telemetry",
+        {"device_id": hardware_id, "received_at": {"$gte": since}},
+        {"_id": 0, "device_id": 1, "received_at": 1, "sensors": 1},
+        batch_size=5000,
+    )
+    chunk: List[Dict[str, Any]] = []
+    total = 0
+    async for doc in cursor:
+        chunk.append(doc)
+        if len(chunk) >= 5000:
+            await write_rollups_async(chunk)
+            total += len(chunk)
+            chunk = []
+    if chunk:
+        await write_rollups_async(chunk)
+        total += len(chunk)
+    return {"device_id": hardware_id, "since": since, "readings": total}
+
+# --- Telemetry Export ---
+
+EXPORT_CSV_COLUMNS = ["device_id", "captured_at", "received_at"] + [f"sensors.{c}" for c in SENSOR_COLUMNS]
+
+async def iter_export_docs(hardware_id: str, start: Optional[datetime], end: Optional[datetime]) -> AsyncIterator[Dict[str, Any]]:
+    """Yields raw telemetry oldest first without materializing the range."""
+    if ASYNC_MONGO_STORAGE:
+        query: Dict[str, Any] = {"device_id": hardware_id}
+        if start or end:
+            query["received_at"] = {}
+            if start:
+                query["received_at"]["$gte"] = start
+            if end:
+                query["received_at"]["$lt"] = end
+        cursor = ASYNC_MONGO_STORAGE.find(
+            "telemetry", query, {"_id": 0}, sort="received_at", batch_size=EXPORT_BATCH_SIZE
+        )
+        try:
+            async for doc in cursor:
+                yield doc
+        finally:
+            await cursor.close()
+        return
+
+    for t in TELEMETRY_CACHE.last(hardware_id):
+        if (not start or t.received_at >= start) and (not end or t.received_at < end):
+            yield model_to_dict(t)
+
+async def iter_ndjson(docs: AsyncIterator[Dict[str, Any]]) -> AsyncIterator[str]:
+    async for doc in docs:
+        yield json.dumps(doc, default=json_default, ensure_ascii=False) + "\n"
+
+async def iter_csv(docs: AsyncIterator[Dict[str, Any]]) -> AsyncIterator[str]:
+    """One row per reading with the nested sensors flattened to sensors.* columns."""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(EXPORT_CSV_COLUMNS)
+    async for doc in docs:
+        sensors = doc.get("sensors") or {}
+        writer.writerow(
+            [doc.get("device_id")]
+            + [json_default(doc[key]) if doc.get(key) is not None else "" for key in ("captured_at", "received_at")]
+            + [sensors.get(column, "") for column in SENSOR_COLUMNS]
+        )
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+
+async def iter_chunks(lines: AsyncIterator[str], compress: bool) -> AsyncIterator[bytes]:
+    """Groups lines into ~EXPORT_CHUNK_BYTES chunks, optionally gzip-compressed."""
+    compressor = zlib.compressobj(wbits=31) if compress else None  # wbits=31 -> gzip container
+    pending: List[bytes] = []
+    size = 0
+    async for line in lines:
+        data = line.encode("utf-8")
+        pending.append(data)
+        size += len(data)
+        if size >= EXPORT_CHUNK_BYTES:
+            chunk = b"".join(pending)
+            pending, size = [], 0
+            chunk = compressor.compress(chunk) if compressor else chunk
+            if chunk:
+                yield chunk
+    chunk = b"".join(pending)
+    if compressor:
+        chunk = compressor.compress(chunk) + compressor.flush()
+    if chunk:
+        yield chunk
+
+@app.get("/devices/{hardware_id}/telemetry/export")
+async def export_device_telemetry(
+    hardware_id: str,
+    format: str = "ndjson",
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    gzip: bool = False,
+):
+    """
+    Streams raw telemetry (oldest first) as NDJSON or CSV. Rows are read
+    from a Mongo cursor in batches and written out in chunks, so memory use
+    does not depend on the size of the range.
+    """
+    if format == "ndjson":
+        lines, media_type = iter_ndjson(iter_export_docs(hardware_id, start, end)), "application/x-ndjson"
+    elif format == "csv":
+        lines, media_type = iter_csv(iter_export_docs(hardware_id, start, end)), "text/csv"
+    else:
+        raise HTTPException(status_code=400, detail="format must be ndjson or csv")
+
+    headers = {"Content-Disposition": f'attachment; filename="{hardware_id}-telemetry.{format}"'}
+    if gzip:
+        headers["Content-Encoding"] = "gzip"
+    return StreamingResponse(iter_chunks(lines, gzip), media_type=media_type, headers=headers)
 
 @app.get("/devices/{hardware_id}/telemetry/latest", response_model=TelemetryRecord)
-def latest_device_telemetry(hardware_id: str):
+async def latest_device_telemetry(hardware_id: str):
     # Try to find latest in memory first (faster)
-    for t in reversed(telemetry_log):
-        if t.device_id == hardware_id:
-            return t
+    cached = TELEMETRY_CACHE.latest(hardware_id)
+    if cached is not None:
+        return cached
             
     # Fallback to DB
-    if MONGO_STORAGE:
-        data = MONGO_STORAGE.db["telemetry"].find_one(
+    if ASYNC_MONGO_STORAGE:
+        data = await ASYNC_MONGO_STORAGE.find_one(
+            "telemetry",
             {"device_id": hardware_id}, 
+            TELEMETRY_PROJECTION,
             sort=[("received_at", -1)]
         )
         if data:
-            data.pop("_id", None)
-            return TelemetryRecord(**data)
+            return raw_json_response(data)
 
     raise HTTPException(status_code=404, detail="No telemetry found for this device.")
 
 @app.get("/notifications", response_model=List[Notification])
-def list_notifications(limit: int = 50):
+async def list_notifications(limit: int = 50):
     limit = max(1, min(limit, 200))
     return list(notifications)[-limit:]
 
+@app.get("/devices/{hardware_id}/alerts")
+async def device_alert_state(hardware_id: str) -> Dict[str, Any]:
+    """Current alert state per metric for a device."""
+    return {"device_id": hardware_id, "metrics": ALERT_ENGINE.state(hardware_id)}
+
+@app.get("/devices/{hardware_id}/alerts/recheck")
+async def recheck_device_history(hardware_id: str, hours: float = 24) -> Dict[str, Any]:
+    """
+    Re-evaluates stored telemetry against the device's current targets,
+    e.g. after the targets were changed. Read-only: no notifications are sent.
+    """
+    hours = max(0.0, min(hours, 24 * 31))
+    since = datetime.utcnow() - timedelta(hours=hours)
+    if ASYNC_MONGO_STORAGE:
+        docs = await ASYNC_MONGO_STORAGE.find(
+            "telemetry",
+            {"device_id": hardware_id, "received_at": {"$gte": since}},
+            {"_id": 0, "sensors": 1, "received_at": 1},
+            sort="received_at",
+            limit=ALERT_RECHECK_MAX_READINGS,
+            batch_size=5000,
+        ).to_list()
+    else:
+        docs = [
+            {"sensors": model_to_dict(t.sensors), "received_at": t.received_at}
+            for t in TELEMETRY_CACHE.last(hardware_id)
+            if t.received_at >= since
+        ]
+
+    config = await get_or_create_device_config(hardware_id)
+    rules = RULE_ENGINE.compile(config)
+    values = sensor_matrix([doc.get("sensors", {}) for doc in docs])
+    _, low, high, _, _ = RuleEngine.evaluate(values, rules)
+    violated = low | high
+
+    metrics = {}
+    for j, metric in enumerate(rules.metrics):
+        hits = np.flatnonzero(violated[:, j])
+        metrics[metric] = {
+            "min": float(rules.mins[j]),
+            "max": float(rules.maxs[j]),
+            "below_min": int(low[:, j].sum()),
+            "above_max": int(high[:, j].sum()),
+            "first_violation": docs[hits[0]]["received_at"] if hits.size else None,
+            "last_violation": docs[hits[-1]]["received_at"] if hits.size else None,
+        }
+    return {"device_id": hardware_id, "readings": len(docs), "since": since, "metrics": metrics}
+
 # --- Demo Control Endpoints ---
 
-@app.get("/devices/{hardware_id}/demo_control", response_model=DemoControl)
-def get_demo_control(hardware_id: str):
-    """Fetch the current demo actuator states from the demo_control collection."""
-    if MONGO_STORAGE:
-        data = MONGO_STORAGE.db["demo_control"].find_one({"hardware_id": hardware_id})
+async def load_demo_control(hardware_id: str) -> Optional[DemoControl]:
+    if ASYNC_MONGO_STORAGE:
+        data = await ASYNC_MONGO_STORAGE.find_one("demo_control", {"hardware_id": hardware_id})
         if data:
             data.pop("_id", None)
             return DemoControl(**data)
-    # Return defaults if no document exists
-    return DemoControl(hardware_id=hardware_id)
+    return None
+
+@app.get("/devices/{hardware_id}/demo_control", response_model=DemoControl)
+async def get_demo_control(
+    hardware_id: str,
+    response: Response,
+    if_none_match: Optional[str] = Header(None),
+    wait: float = 0,
+):
+    """
+    Fetch the current demo actuator states from the demo_control collection.
+    Carries a weak ETag; a matching If-None-Match gets an empty 304.
+
+    Long-poll: with ``wait`` (seconds, capped at DEMO_CONTROL_MAX_WAIT_S) and
+    a matching If-None-Match, the request is held until the state changes,
+    then answered with the new state, or with 304 once the wait runs out.
+    """
+    deadline = time_lib.monotonic() + max(0.0, min(wait, DEMO_CONTROL_MAX_WAIT_S))
+    while True:
+        etag = RESOURCE_VERSIONS.match("demo_control", hardware_id, if_none_match)
+        if etag is None:
+            control = await load_demo_control(hardware_id)
+            etag = RESOURCE_VERSIONS.put("demo_control", hardware_id, control.updated_at if control else None)
+            if not etag_matches(if_none_match, etag):
+                RESOURCE_VERSIONS.record(not_modified=False)
+                response.headers["ETag"] = etag
+                response.headers["Cache-Control"] = "no-cache"
+                # Return defaults if no document exists
+                return control or DemoControl(hardware_id=hardware_id)
+            if RESOURCE_VERSIONS.match("demo_control", hardware_id, etag) is None:
+                continue  # a newer write landed during the load and has already notified
+
+        remaining = deadline - time_lib.monotonic()
+        if remaining <= 0:
+            RESOURCE_VERSIONS.record(not_modified=True)
+            return not_modified_response(etag)
+        # No await since the version check, so a change cannot slip in unnoticed
+        await DEMO_CONTROL_CHANGES.wait(hardware_id, remaining)
+
+@app.get("/devices/{hardware_id}/demo_control/events")
+async def stream_demo_control(
+    hardware_id: str,
+    request: Request,
+    last_event_id: Optional[str] = Header(None),
+):
+    """
+    Server-Sent Events stream of demo_control: the current state on connect
+    (unless Last-Event-ID already names it), then one event per change.
+    Event ids are the ETags served by GET /demo_control.
+    """
+    return StreamingResponse(
+        iter_demo_control_events(hardware_id, request, last_event_id),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+async def iter_demo_control_events(
+    hardware_id: str, request: Request, last_event_id: Optional[str]
+) -> AsyncIterator[str]:
+    sent_etag = last_event_id
+    while not await request.is_disconnected():
+        etag = RESOURCE_VERSIONS.match("demo_control", hardware_id, sent_etag)
+        if etag is None:
+            control = await load_demo_control(hardware_id)
+            etag = RESOURCE_VERSIONS.put("demo_control", hardware_id, control.updated_at if control else None)
+            if not etag_matches(sent_etag, etag):
+                data = json.dumps(
+                    model_to_dict(control or DemoControl(hardware_id=hardware_id)), default=json_default
+                )
+                yield f"id: {etag}\nevent: demo_control\ndata: {data}\n\n"
+                sent_etag = etag
+                continue
+            if RESOURCE_VERSIONS.match("demo_control", hardware_id, etag) is None:
+                continue  # a newer write landed during the load and has already notified
+        if not await DEMO_CONTROL_CHANGES.wait(hardware_id, DEMO_CONTROL_SSE_KEEPALIVE_S):
+            yield ": keepalive\n\n"
 
 @app.post("/devices/{hardware_id}/demo_control", response_model=DemoControl)
-def update_demo_control(hardware_id: str, payload: Dict[str, Any]):
+async def update_demo_control(hardware_id: str, payload: Dict[str, Any]):
     """Update actuator toggle states in the demo_control collection."""
     # Build the update from current state + incoming changes
-    existing = get_demo_control(hardware_id)
+    existing = await load_demo_control(hardware_id) or DemoControl(hardware_id=hardware_id)
     existing_data = model_to_dict(existing)
     updated_data = deep_merge(payload, existing_data)
     updated_data["hardware_id"] = hardware_id
     updated_data["updated_at"] = datetime.utcnow()
 
-    if MONGO_STORAGE:
-        MONGO_STORAGE.db["demo_control"].update_one(
+    if ASYNC_MONGO_STORAGE:
+        await ASYNC_MONGO_STORAGE.update_one(
+            "demo_control",
             {"hardware_id": hardware_id},
             {"$set": updated_data},
             upsert=True
         )
+    RESOURCE_VERSIONS.put("demo_control", hardware_id, updated_data["updated_at"])
+    DEMO_CONTROL_CHANGES.notify(hardware_id)
 
     return DemoControl(**updated_data)
 
 
-@app.post("/devices/{hardware_id}/send_email")
-def send_status_email(hardware_id: str) -> Dict[str, Any]:
-    """Send a water-level alert email to the device owner if water is below target."""
+@app.post("/devices/{hardware_id}/send_email", status_code=202)
+async def send_status_email(hardware_id: str) -> Dict[str, Any]:
+    """
+    Queue a water-level status email to the device owner.
+    Returns 202 with a job id that can be polled at /email_jobs/{job_id}.
+    """
     # 1. Verify email settings are configured
-    if not EMAIL_SETTINGS:
+    if not EMAIL_DISPATCHER:
         raise HTTPException(
             status_code=503,
             detail="Email is not configured on the server. Check SMTP environment variables.",
         )
 
     # 2. Look up device owner email
-    device_config = get_or_create_device_config(hardware_id)
+    device_config = await get_or_create_device_config(hardware_id)
     owner_email = device_config.owner_id.replace("\xa0", "").strip()
     if not owner_email or owner_email == "default_user":
         raise HTTPException(
@@ -430,26 +2989,41 @@ def send_status_email(hardware_id: str) -> Dict[str, Any]:
             detail="No owner email found for this device. Complete onboarding first.",
         )
 
-    # 3. Enforce 24-hour cooldown
-    if MONGO_STORAGE:
-        demo_doc = MONGO_STORAGE.db["demo_control"].find_one({"hardware_id": hardware_id})
-        if demo_doc and demo_doc.get("last_email_sent"):
-            last_sent = demo_doc["last_email_sent"]
-            if isinstance(last_sent, str):
-                last_sent = datetime.fromisoformat(last_sent)
-            hours_since = (datetime.utcnow() - last_sent).total_seconds() / 3600
-            if hours_since < 24:
-                hours_left = round(24 - hours_since, 1)
-                raise HTTPException(
-                    status_code=429,
-                    detail=f"Email already sent {round(hours_since, 1)}h ago. Next email available in {hours_left}h.",
-                )
+    # 3. Enforce 24-hour cooldown, reserving it until the email is sent or fails
+    if ASYNC_MONGO_STORAGE and not await reserve_status_email(hardware_id, datetime.utcnow()):
+        demo_doc = await ASYNC_MONGO_STORAGE.find_one(
+            "demo_control", {"hardware_id": hardware_id}, {"_id": 0, "last_email_sent": 1}
+        )
+        last_sent = (demo_doc or {}).get("last_email_sent")
+        if isinstance(last_sent, str):
+            last_sent = datetime.fromisoformat(last_sent)
+        if last_sent is None:
+            raise HTTPException(status_code=429, detail="A status email is already queued for this device.")
+        hours_since = (datetime.utcnow() - last_sent).total_seconds() / 3600
+        hours_left = round(max(0.0, 24 - hours_since), 1)
+        raise HTTPException(
+            status_code=429,
+            detail=f"Email already sent {round(hours_since, 1)}h ago. Next email available in {hours_left}h.",
+        )
+
+    try:
+        return await queue_status_email(hardware_id, device_config, owner_email)
+    except BaseException:
+        if ASYNC_MONGO_STORAGE:
+            await ASYNC_MONGO_STORAGE.update_one(
+                "demo_control", {"hardware_id": hardware_id}, {"$unset": {"status_email_pending": ""}}
+            )
+        raise
 
+async def queue_status_email(hardware_id: str, device_config: DeviceConfig, owner_email: str) -> Dict[str, Any]:
     # 4. Get latest telemetry and check water level against target
     water_level = None
-    if MONGO_STORAGE:
-        latest = MONGO_STORAGE.db["telemetry"].find_one(
-            {"device_id": hardware_id}, sort=[("received_at", -1)]
+    if ASYNC_MONGO_STORAGE:
+        latest = await ASYNC_MONGO_STORAGE.find_one(
+            "telemetry",
+            {"device_id": hardware_id},
+            {"_id": 0, "sensors.water_level_pct": 1},
+            sort=[("received_at", -1)],
         )
         if latest and "sensors" in latest:
             water_level = latest["sensors"].get("water_level_pct")
@@ -473,33 +3047,38 @@ def send_status_email(hardware_id: str) -> Dict[str, Any]:
             f"No action needed."
         )
 
-    # 4. Send the email
+    # 5. Queue the email; the timestamp is recorded in demo_control once it is sent,
+    # and the reservation is released if it is dead-lettered
     try:
-        EMAIL_SETTINGS["client"].send_email(
+        job = EMAIL_DISPATCHER.enqueue(
             subject=subject,
             body=body,
-            from_email=EMAIL_SETTINGS["from_email"],
             to_emails=[owner_email],
+            device_id=hardware_id,
+            on_sent=lambda job: record_status_email_sent(hardware_id, job.updated_at),
+            on_failed=lambda job: release_status_email(hardware_id),
         )
-    except Exception as exc:
-        logging.error("Failed to send status email: %s", exc, exc_info=True)
-        raise HTTPException(status_code=500, detail=f"Email send failed: {exc}")
-
-    # 5. Record timestamp in demo_control
-    sent_at = datetime.utcnow()
-    if MONGO_STORAGE:
-        MONGO_STORAGE.db["demo_control"].update_one(
-            {"hardware_id": hardware_id},
-            {"$set": {"last_email_sent": sent_at, "updated_at": sent_at}},
-            upsert=True,
+    except queue.Full:
+        raise HTTPException(
+            status_code=503,
+            detail="Email queue is full, try again shortly.",
+            headers={"Retry-After": "5"},
         )
 
-    logging.info("Status email sent to %s for device %s", owner_email, hardware_id)
+    logging.info("Status email queued for %s (device %s, job %s)", owner_email, hardware_id, job.id)
     return {
-        "status": "ok",
+        "status": "queued",
+        "job_id": job.id,
         "sent_to": owner_email,
-        "sent_at": sent_at.isoformat(),
         "water_level": water_level,
         "water_min_target": water_min,
         "is_below_target": water_level is not None and water_level < water_min,
-    }
\ No newline at end of file
+    }
+
+@app.get("/email_jobs/{job_id}", response_model=EmailJob)
+async def get_email_job(job_id: str):
+    """Poll the delivery state of a queued email."""
+    job = EMAIL_DISPATCHER.get_job(job_id) if EMAIL_DISPATCHER else None
+    if job is None:
+        raise HTTPException(status_code=404, detail="Unknown or expired email job.")
+    return job
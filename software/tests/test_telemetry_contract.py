@@ -0,0 +1,157 @@
+"""Raw telemetry reads skip per-row validation; these tests hold the stored
+documents to the TelemetryRecord schema instead, and check what a batch
+ingest reports when the store rejects some of its readings."""
+
+import os
+import sys
+from pathlib import Path
+from unittest import mock
+
+import mongomock
+import pytest
+from fastapi.testclient import TestClient
+from pymongo.errors import BulkWriteError
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT))
+sys.path.insert(0, str(ROOT / "src" / "server"))
+
+# The sync client fails fast against an unreachable server, so main starts
+# without Mongo and the tests inject their own storage below
+os.environ["MONGO_URI"] = "mongodb://127.0.0.1:1"
+os.environ["MONGO_SERVER_SELECTION_TIMEOUT_MS"] = "100"
+os.environ["TELEMETRY_WRITE_BEHIND"] = "false"
+os.environ["TELEMETRY_ROLLUPS"] = "false"
+
+import main  # noqa: E402
+from libs.mongo.storage import MongoConfig, MongoStorage  # noqa: E402
+
+SENSORS = {
+    "air_temp_c": 22.5,
+    "humidity_pct": 48.0,
+    "light_intensity_pct": 80.0,
+    "water_level_pct": 75.0,
+    "nutrient_a_pct": 60.0,
+    "moisture_pct": 42.0,
+}
+
+
+class CursorStub:
+    def __init__(self, cursor) -> None:
+        self._cursor = cursor
+
+    async def to_list(self, length=None):
+        return list(self._cursor)
+
+    def __aiter__(self):
+        self._iter = iter(self._cursor)
+        return self
+
+    async def __anext__(self):
+        try:
+            return next(self._iter)
+        except StopIteration:
+            raise StopAsyncIteration
+
+
+class AsyncStorageStub:
+    """AsyncMongoStorage stand-in that runs MongoStorage calls on mongomock inline."""
+
+    def __init__(self, storage: MongoStorage) -> None:
+        self._storage = storage
+
+    def find(self, *args, **kwargs):
+        return CursorStub(self._storage.find(*args, **kwargs))
+
+    def __getattr__(self, name):
+        method = getattr(self._storage, name)
+
+        async def call(*args, **kwargs):
+            return method(*args, **kwargs)
+
+        return call
+
+
+@pytest.fixture
+def client():
+    with mock.patch("libs.mongo.storage.MongoClient", mongomock.MongoClient):
+        storage = MongoStorage(MongoConfig(uri="mongodb://stub", db_name="plantbox_test"))
+    with mock.patch.object(main, "ASYNC_MONGO_STORAGE", AsyncStorageStub(storage)):
+        yield TestClient(main.app)
+    main.TELEMETRY_CACHE = main.TelemetryHotCache(
+        main.TELEMETRY_CACHE_PER_DEVICE, main.TELEMETRY_CACHE_MAX_RECORDS
+    )
+
+
+def assert_telemetry_record(row):
+    fields = set(getattr(main.TelemetryRecord, "model_fields", None) or main.TelemetryRecord.__fields__)
+    assert set(row) == fields
+    main.TelemetryRecord(**row)
+
+
+def ingest(client, device_id):
+    response = client.post("/sendTelemetry", json={"device_id": device_id, "sensors": SENSORS})
+    assert response.status_code == 200
+    response = client.post(
+        "/sendTelemetryBatch",
+        json={"readings": [{"device_id": device_id, "sensors": {**SENSORS, "power_mw": 900.0}}]},
+    )
+    assert response.status_code == 200
+    # Force the latest reading to come from Mongo rather than the hot cache
+    main.TELEMETRY_CACHE = main.TelemetryHotCache(
+        main.TELEMETRY_CACHE_PER_DEVICE, main.TELEMETRY_CACHE_MAX_RECORDS
+    )
+
+
+def test_telemetry_list_matches_record_schema(client):
+    ingest(client, "contract-1")
+
+    rows = client.get("/devices/contract-1/telemetry").json()
+
+    assert len(rows) == 2
+    for row in rows:
+        assert_telemetry_record(row)
+
+
+def test_telemetry_since_matches_record_schema(client):
+    ingest(client, "contract-2")
+    first = client.get("/devices/contract-2/telemetry", params={"limit": 1}).json()[0]
+
+    rows = client.get("/devices/contract-2/telemetry", params={"since": "2000-01-01T00:00:00"}).json()
+
+    assert [row["received_at"] for row in rows][-1] == first["received_at"]
+    for row in rows:
+        assert_telemetry_record(row)
+
+
+def test_latest_telemetry_matches_record_schema(client):
+    ingest(client, "contract-3")
+
+    response = client.get("/devices/contract-3/telemetry/latest")
+
+    assert response.status_code == 200
+    assert_telemetry_record(response.json())
+
+
+def test_batch_reports_rejected_readings(client):
+    storage = main.ASYNC_MONGO_STORAGE._storage
+    insert_many = storage.insert_many
+
+    def reject_second(collection, documents, ordered=False):
+        insert_many(collection, [documents[0], documents[2]])
+        raise BulkWriteError({
+            "writeErrors": [{"index": 1, "code": 121, "errmsg": "Document failed validation"}],
+            "writeConcernErrors": [],
+        })
+
+    readings = [{"device_id": "contract-4", "sensors": SENSORS} for _ in range(3)]
+    with mock.patch.object(storage, "insert_many", reject_second):
+        response = client.post("/sendTelemetryBatch", json={"readings": readings})
+
+    assert response.status_code == 200
+    body = response.json()
+    assert body["status"] == "partial"
+    assert body["accepted"] == 2
+    assert body["rejected"] == [1]
+    assert [result["stored"] for result in body["results"]] == [True, False, True]
+    assert len(client.get("/devices/contract-4/telemetry").json()) == 2